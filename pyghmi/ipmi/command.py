@@ -808,8 +808,7 @@ class Command(object):
                                        data=(currsensor.sensor_number,))
                 if 'error' in rsp:
                     raise exc.IpmiException(rsp['error'], rsp['code'])
-                return self._sdr.sensors[sensor].decode_sensor_reading(
-                    self, rsp['data'])
+                return currsensor.decode_sensor_reading(self, rsp['data'])
         self.oem_init()
         return self._oem.get_sensor_reading(sensorname)
 
@@ -1081,8 +1080,7 @@ class Command(object):
                 if rsp['code'] == 203:  # Sensor does not exist, optional dev
                     continue
                 raise exc.IpmiException(rsp['error'], code=rsp['code'])
-            yield self._sdr.sensors[sensor].\
-                decode_sensor_reading(self, rsp['data'])
+            yield currsensor.decode_sensor_reading(self, rsp['data'])
         self.oem_init()
         for reading in self._oem.get_sensor_data():
             yield reading
@@ -15,6 +15,7 @@
 #
 """This represents the low layer message framing portion of IPMI"""
 
+import collections
 import struct
 import threading
 
@@ -24,6 +25,35 @@ from pyghmi.ipmi.private import session
 from pyghmi.ipmi.private.util import _monotonic_time
 
 
+_sol_header = struct.Struct('4B')
+
+# kinds of entries in the pending output queue, which holds (kind, data)
+_PENDING_TEXT = 0
+_PENDING_BREAK = 1
+
+# data for activate (0x48) and deactivate (0x49) payload:
+# (1, sol payload type
+#  1, first instance
+#  0b11000000, -encrypt, authenticate,
+#                disable serial/modem alerts, CTS fine
+#  0, 0, 0 reserved
+_SOL_ACTIVATE_DATA = (1, 1, 192, 0, 0, 0)
+_SOL_DEACTIVATE_DATA = (1, 1, 0, 0, 0, 0)
+# get payload instance info (0x4b) for the first SOL instance, used as the
+# keepalive for the console
+_SOL_KEEPALIVE_CMD = {'netfn': 6, 'command': 0x4b, 'data': (1, 1)}
+
+# given that these are specific to the command,
+# it's probably best if one can grep the error
+# here instead of in constants
+_SOL_ACTIVATE_CODES = {
+    0x81: 'SOL is disabled',
+    0x82: 'Maximum SOL session count reached',
+    0x83: 'Cannot activate payload with encryption',
+    0x84: 'Cannot activate payload without encryption',
+}
+
+
 class Console(object):
     """IPMI SOL class.
 
@@ -44,7 +74,7 @@ class Console(object):
     def __init__(self, bmc, userid, password,
                  iohandler, port=623,
                  force=False, kg=None):
-        self.outputlock = threading.RLock()
+        self.outputlock = threading.Lock()
         self.keepaliveid = None
         self.connected = False
         self.broken = False
@@ -53,22 +83,28 @@ class Console(object):
         self.myseq = 0
         self.lastsize = 0
         self.retriedpayload = 0
-        self.pendingoutput = []
+        self.pendingoutput = collections.deque()
         self.awaitingack = False
         self.activated = False
         self.force_session = force
         self.port = port
         self.ipmi_session = None
         self.callgotsession = None
+        self._pumped = False
         self.ipmi_session = session.Session(bmc=bmc,
                                             userid=userid,
                                             password=password,
                                             port=port,
                                             kg=kg,
                                             onlogon=self._got_session)
-        # induce one iteration of the loop, now that we would be
-        # prepared for it in theory
-        session.Session.wait_for_rsp(0)
+        # The event loop is not run here for a session still logging in, so
+        # constructing many consoles in a row does not run it once per
+        # console.  The caller's loop will deliver the logon, or the first
+        # send will run one iteration.  A reused session that is already
+        # logged in only hands over onlogon from the loop, so pump it now
+        # as before rather than leave activation to the caller's loop.
+        if self.ipmi_session.logged and not self.ipmi_session.logging:
+            self._pump_once()
         if self.callgotsession is not None:
             self._got_session(self.callgotsession)
             self.callgotsession = None
@@ -85,22 +121,8 @@ class Console(object):
         # Send activate sol payload directive
         # netfn= 6 (application)
         # command = 0x48 (activate payload)
-        # data = (1, sol payload type
-        #        1, first instance
-        #        0b11000000, -encrypt, authenticate,
-        #                      disable serial/modem alerts, CTS fine
-        #        0, 0, 0 reserved
         response = self.ipmi_session.raw_command(netfn=0x6, command=0x48,
-                                                 data=(1, 1, 192, 0, 0, 0))
-        # given that these are specific to the command,
-        # it's probably best if one can grep the error
-        # here instead of in constants
-        sol_activate_codes = {
-            0x81: 'SOL is disabled',
-            0x82: 'Maximum SOL session count reached',
-            0x83: 'Cannot activate payload with encryption',
-            0x84: 'Cannot activate payload without encryption',
-        }
+                                                 data=_SOL_ACTIVATE_DATA)
         if 'code' in response and response['code']:
             if response['code'] in constants.ipmi_completion_codes:
                 self._print_error(
@@ -112,14 +134,14 @@ class Console(object):
                     sessrsp = self.ipmi_session.raw_command(
                         netfn=0x6,
                         command=0x49,
-                        data=(1, 1, 0, 0, 0, 0))
+                        data=_SOL_DEACTIVATE_DATA)
                     self._got_session(sessrsp)
                     return
                 else:
                     self._print_error('SOL Session active for another client')
                     return
-            elif response['code'] in sol_activate_codes:
-                self._print_error(sol_activate_codes[response['code']])
+            elif response['code'] in _SOL_ACTIVATE_CODES:
+                self._print_error(_SOL_ACTIVATE_CODES[response['code']])
                 return
             else:
                 self._print_error(
@@ -137,8 +159,8 @@ class Console(object):
         # data[6:7] is the promise of how small packets are going to be, but we
         # don't have any reason to worry about it
         # some BMCs disagree on the endianness, so do both
-        valid_ports = (self.port, struct.unpack(
-            '<H', struct.pack('>H', self.port))[0])
+        valid_ports = (self.port,
+                       ((self.port & 0xff) << 8) | ((self.port >> 8) & 0xff))
         if (data[8] + (data[9] << 8)) not in valid_ports:
             # TODO(jbjohnso): support atypical SOL port number
             raise NotImplementedError("Non-standard SOL Port Number")
@@ -151,7 +173,7 @@ class Console(object):
             # it of newly established session
             self.ipmi_session.sol_handler({'error': 'Session Disconnected'})
         self.keepaliveid = self.ipmi_session.register_keepalive(
-            cmd={'netfn': 6, 'command': 0x4b, 'data': (1, 1)},
+            cmd=_SOL_KEEPALIVE_CMD,
             callback=self._got_payload_instance_info)
         self.ipmi_session.sol_handler = self._got_sol_payload
         self.connected = True
@@ -163,9 +185,8 @@ class Console(object):
             self.activated = False
             self._print_error(response['error'])
             return
-        currowner = struct.unpack(
-            "<I", struct.pack('4B', *response['data'][:4]))
-        if currowner[0] != self.ipmi_session.sessionid:
+        currowner = int.from_bytes(bytes(response['data'][:4]), 'little')
+        if currowner != self.ipmi_session.sessionid:
             # the session is deactivated or active for something else
             self.activated = False
             self._print_error('SOL deactivated')
@@ -178,15 +199,24 @@ class Console(object):
         # correlates at all to an ipmi channel to check mux
 
     def _addpendingdata(self, data):
+        if isinstance(data, dict):
+            if 'break' not in data:
+                raise ValueError
+            with self.outputlock:
+                self.pendingoutput.append((_PENDING_BREAK, None))
+            return
+        # it is a text situation
+        if not isinstance(data, (bytes, bytearray)):
+            data = data.encode('utf8')
         with self.outputlock:
-            if isinstance(data, dict):
-                self.pendingoutput.append(data)
-            else:  # it is a text situation
-                if (len(self.pendingoutput) == 0
-                        or isinstance(self.pendingoutput[-1], dict)):
-                    self.pendingoutput.append(data)
-                else:
-                    self.pendingoutput[-1] += data
+            # accumulate in a bytearray, so that many small writes
+            # while waiting on an ack do not copy the whole buffer
+            # each time
+            if (self.pendingoutput
+                    and self.pendingoutput[-1][0] == _PENDING_TEXT):
+                self.pendingoutput[-1][1].extend(data)
+            else:
+                self.pendingoutput.append((_PENDING_TEXT, bytearray(data)))
 
     def _got_cons_input(self, handle):
         """Callback for handle events detected by ipmi session"""
@@ -203,7 +233,7 @@ class Console(object):
         if self.activated and self.ipmi_session is not None:
             try:
                 self.ipmi_session.raw_command(netfn=6, command=0x49,
-                                              data=(1, 1, 0, 0, 0, 0))
+                                              data=_SOL_DEACTIVATE_DATA)
             except exc.IpmiException:
                 # if underlying ipmi session is not working, then
                 # run with the implicit success
@@ -212,8 +242,22 @@ class Console(object):
     def send_data(self, data):
         if self.broken:
             return
+        if self.connected and not isinstance(data, dict):
+            if not isinstance(data, (bytes, bytearray)):
+                data = data.encode('utf8')
+            with self.outputlock:
+                # with nothing queued or in flight, send directly rather
+                # than queueing only to dequeue again straight away
+                direct = (not (self.awaitingack or self.pendingoutput)
+                          and len(data) <= self.maxoutcount)
+                if direct:
+                    self.awaitingack = True
+            if direct:
+                self._sendoutput(data)
+                return
         self._addpendingdata(data)
         if not self.connected:
+            self._pump_once()
             return
         if not self.awaitingack:
             self._sendpendingoutput()
@@ -221,10 +265,18 @@ class Console(object):
     def send_break(self):
         self._addpendingdata({'break': 1})
         if not self.connected:
+            self._pump_once()
             return
         if not self.awaitingack:
             self._sendpendingoutput()
 
+    def _pump_once(self):
+        # induce one iteration of the loop, now that we would be
+        # prepared for it in theory
+        if not self._pumped:
+            self._pumped = True
+            session.Session.wait_for_rsp(0)
+
     @classmethod
     def wait_for_rsp(cls, timeout):
         """Delay for no longer than timeout for next response.
@@ -235,44 +287,60 @@ class Console(object):
         """
         return session.Session.wait_for_rsp(timeout=timeout)
 
-    def _sendpendingoutput(self):
+    def _sendpendingoutput(self, ack=None):
+        # Unlocked peek to skip the lock in the common idle case.  If data is
+        # added right after this check, the writer or the next ack will
+        # drive another call, so losing that race is harmless.
+        if not self.pendingoutput:
+            return
         with self.outputlock:
             dobreak = False
-            chunk = ''
-            if len(self.pendingoutput) == 0:
+            chunk = b''
+            if len(self.pendingoutput) == 0 or self.awaitingack:
                 return
-            if isinstance(self.pendingoutput[0], dict):
-                if 'break' in self.pendingoutput[0]:
-                    dobreak = True
-                else:
-                    del self.pendingoutput[0]
-                    raise ValueError
-                del self.pendingoutput[0]
-            elif len(self.pendingoutput[0]) > self.maxoutcount:
-                chunk = self.pendingoutput[0][:self.maxoutcount]
-                self.pendingoutput[0] = self.pendingoutput[0][
-                    self.maxoutcount:]
+            if self.pendingoutput[0][0] == _PENDING_BREAK:
+                dobreak = True
+                self.pendingoutput.popleft()
             else:
-                chunk = self.pendingoutput[0]
-                del self.pendingoutput[0]
-            self._sendoutput(chunk, sendbreak=dobreak)
-
-    def _sendoutput(self, output, sendbreak=False):
-        self.myseq += 1
-        self.myseq &= 0xf
-        if self.myseq == 0:
-            self.myseq = 1
-        # currently we don't try to combine ack with outgoing data
-        # so we use 0 for ack sequence number and accepted character
-        # count
+                # drain as much contiguous text as the BMC will take in one
+                # payload rather than spending a round trip per entry
+                chunk = bytearray()
+                while (self.pendingoutput
+                       and self.pendingoutput[0][0] == _PENDING_TEXT
+                       and len(chunk) < self.maxoutcount):
+                    text = self.pendingoutput[0][1]
+                    room = self.maxoutcount - len(chunk)
+                    if len(text) > room:
+                        chunk.extend(text[:room])
+                        del text[:room]
+                    else:
+                        chunk.extend(text)
+                        self.pendingoutput.popleft()
+            # claim the outbound slot before letting go of the lock so that
+            # another thread does not send a chunk out of order
+            self.awaitingack = True
+        # _sendoutput runs the event loop, which may call back into
+        # _got_sol_payload, so it must not be called with outputlock held
+        self._sendoutput(chunk, sendbreak=dobreak, ack=ack)
+        return True
+
+    def _sendoutput(self, output, sendbreak=False, ack=None):
+        # sequence numbers cycle 1 through 15, 0 is reserved for ack-only
+        # packets
+        self.myseq = (self.myseq % 15) + 1
         breakbyte = 0
         if sendbreak:
             breakbyte = 0b10000
-        try:
-            payload = bytearray((self.myseq, 0, 0, breakbyte)) + output
-        except TypeError:  # bytearray hits unicode...
-            payload = bytearray((self.myseq, 0, 0, breakbyte
-                                 )) + output.encode('utf8')
+        if not isinstance(output, (bytes, bytearray)):
+            output = output.encode('utf8')
+        payload = bytearray(4 + len(output))
+        payload[0] = self.myseq
+        payload[3] = breakbyte
+        payload[4:] = output
+        if ack is not None:
+            # acknowledge remote data (sequence number, accepted character
+            # count) in the same packet
+            payload[1], payload[2] = ack
         self.lasttextsize = len(output)
         needskeepalive = False
         if self.lasttextsize == 0:
@@ -280,16 +348,23 @@ class Console(object):
         self.awaitingack = True
         self.lastpayload = payload
         self.send_payload(payload, retry=False, needskeepalive=needskeepalive)
+        if ack is not None:
+            # do not repeat the ack in retries, by then it may be stale, and
+            # a remote retry will get a fresh ack of its own
+            payload[1] = payload[2] = 0
+        mono = _monotonic_time
         retries = 5
         while retries and self.awaitingack:
-            expiry = _monotonic_time() + 5.5 - retries
-            while self.awaitingack and _monotonic_time() < expiry:
+            # wait 0.5s before the first retry, then a second longer for
+            # each subsequent one
+            expiry = mono() + 5.5 - retries
+            while self.awaitingack and mono() < expiry:
                 self.wait_for_rsp(0.5)
             if self.awaitingack:
                 self.send_payload(payload, retry=False,
                                   needskeepalive=needskeepalive)
             retries -= 1
-        if not retries:
+        if not retries and self.awaitingack:
             self._print_error('Connection lost')
 
     def send_payload(self, payload, payload_type=1, retry=True,
@@ -335,47 +410,41 @@ class Console(object):
         # TODO(jbjohnso) test cases to throw some likely scenarios at functions
         # for example, retry with new data, retry with no new data
         # retry with unexpected sequence number
-        if type(payload) == dict:  # we received an error condition
+        if isinstance(payload, dict):  # we received an error condition
             self.activated = False
             self._print_error(payload)
             return
-        newseq = payload[0] & 0b1111
-        ackseq = payload[1] & 0b1111
-        ackcount = payload[2]
-        nacked = payload[3] & 0b1000000
-        poweredoff = payload[3] & 0b100000
-        deactivated = payload[3] & 0b10000
-        breakdetected = payload[3] & 0b100
+        newseq, ackseq, ackcount, status = payload[:4]
+        newseq &= 0xf
+        ackseq &= 0xf
+        nacked = status & 0b1000000
+        poweredoff = status & 0b100000
+        deactivated = status & 0b10000
+        breakdetected = status & 0b100
         # for now, ignore overrun.  I assume partial NACK for this reason or
         # for no reason would be treated the same, new payload with partial
         # data.
         remdata = ""
         remdatalen = 0
+        ack = None
         if newseq != 0:  # this packet at least has some data to send to us..
             if len(payload) > 4:
-                remdatalen = len(payload[4:])  # store remote len before dupe
+                remdatalen = len(payload) - 4  # store remote len before dupe
                 # retry logic, we must ack *this* many even if it is
                 # a retry packet with new partial data
-                remdata = bytes(payload[4:])
+                remdata = memoryview(payload)[4:]
             if newseq == self.remseq:  # it is a retry, but could have new data
                 if remdatalen > self.lastsize:
-                    remdata = bytes(remdata[4 + self.lastsize:])
+                    remdata = remdata[self.lastsize:]
                 else:  # no new data...
                     remdata = ""
             else:  # TODO(jbjohnso) what if remote sequence number is wrong??
                 self.remseq = newseq
             self.lastsize = remdatalen
             if remdata:  # Do not subject callers to empty data
-                self._print_data(remdata)
-            ackpayload = bytearray((0, self.remseq, remdatalen, 0))
-            # Why not put pending data into the ack? because it's rare
-            # and might be hard to decide what to do in the context of
-            # retry situation
-            try:
-                self.send_payload(ackpayload, retry=False)
-            except exc.IpmiException:
-                # if the session is broken, then close the SOL session
-                self.close()
+                self._print_data(bytes(remdata))
+            # the ack goes out once the rest of this packet is handled
+            ack = (self.remseq, remdatalen)
         if self.myseq != 0 and ackseq == self.myseq:  # the bmc has something
             # to say about last xmit
             self.awaitingack = False
@@ -385,19 +454,22 @@ class Console(object):
                 if deactivated:
                     self.activated = False
                     self._print_error("Remote IPMI console disconnected")
+                    # the session is being torn down, do not ack or send
+                    return
                 else:  # retry all or part of packet, but in a new form
                     # also add pending output for efficiency and ease
                     newtext = self.lastpayload[4 + ackcount:]
                     with self.outputlock:
                         if (self.pendingoutput
-                                and not isinstance(self.pendingoutput[0],
-                                                   dict)):
-                            self.pendingoutput[0] = \
-                                newtext + self.pendingoutput[0]
+                                and self.pendingoutput[0][0] == _PENDING_TEXT):
+                            newtext.extend(self.pendingoutput[0][1])
+                            self.pendingoutput[0] = (_PENDING_TEXT, newtext)
                         else:
-                            self.pendingoutput = [newtext] + self.pendingoutput
-            # self._sendpendingoutput() checks len(self._sendpendingoutput)
-            self._sendpendingoutput()
+                            self.pendingoutput.appendleft(
+                                (_PENDING_TEXT, newtext))
+            if ack is None:
+                # self._sendpendingoutput() checks len(self._sendpendingoutput)
+                self._sendpendingoutput()
         elif ackseq != 0 and self.awaitingack:
             # if an ack packet came in, but did not match what we
             # expected, retry our payload now.
@@ -408,6 +480,16 @@ class Console(object):
             # occasional retry of a packet
             # sooner than timeout suggests is evidently a big deal
             self.send_payload(payload=self.lastpayload, retry=False)
+        if ack is not None and not self.broken:
+            # If nothing of ours is in flight, let pending output carry our
+            # ack rather than sending a packet just for the ack.
+            if not self._sendpendingoutput(ack=ack):
+                ackpayload = _sol_header.pack(0, self.remseq, remdatalen, 0)
+                try:
+                    self.send_payload(ackpayload, retry=False)
+                except exc.IpmiException:
+                    # if the session is broken, then close the SOL session
+                    self.close()
 
     def main_loop(self):
         """Process all events until no more sessions exist.
@@ -436,7 +518,7 @@ class ServerConsole(Console):
     """
 
     def __init__(self, _session, iohandler, force=False):
-        self.outputlock = threading.RLock()
+        self.outputlock = threading.Lock()
         self.keepaliveid = None
         self.connected = True
         self.broken = False
@@ -445,7 +527,7 @@ class ServerConsole(Console):
         self.myseq = 0
         self.lastsize = 0
         self.retriedpayload = 0
-        self.pendingoutput = []
+        self.pendingoutput = collections.deque()
         self.awaitingack = False
         self.activated = True
         self.force_session = force
@@ -454,23 +536,21 @@ class ServerConsole(Console):
         self.maxoutcount = 256
         self.poweredon = True
 
-        session.Session.wait_for_rsp(0)
-
     def _got_sol_payload(self, payload):
         """SOL payload callback"""
 
         # TODO(jbjohnso) test cases to throw some likely scenarios at functions
         # for example, retry with new data, retry with no new data
         # retry with unexpected sequence number
-        if type(payload) == dict:  # we received an error condition
+        if isinstance(payload, dict):  # we received an error condition
             self.activated = False
             self._print_error(payload)
             return
-        newseq = payload[0] & 0b1111
-        ackseq = payload[1] & 0b1111
-        ackcount = payload[2]
-        nacked = payload[3] & 0b1000000
-        breakdetected = payload[3] & 0b10000
+        newseq, ackseq, ackcount, status = payload[:4]
+        newseq &= 0xf
+        ackseq &= 0xf
+        nacked = status & 0b1000000
+        breakdetected = status & 0b10000
         # for now, ignore overrun.  I assume partial NACK for this reason or
         # for no reason would be treated the same, new payload with partial
         # data.
@@ -483,19 +563,19 @@ class ServerConsole(Console):
             flag |= 0b1010000
         if newseq != 0:  # this packet at least has some data to send to us..
             if len(payload) > 4:
-                remdatalen = len(payload[4:])  # store remote len before dupe
+                remdatalen = len(payload) - 4  # store remote len before dupe
                 # retry logic, we must ack *this* many even if it is
                 # a retry packet with new partial data
-                remdata = bytes(payload[4:])
+                remdata = memoryview(payload)[4:]
             if newseq == self.remseq:  # it is a retry, but could have new data
                 if remdatalen > self.lastsize:
-                    remdata = bytes(remdata[4 + self.lastsize:])
+                    remdata = remdata[self.lastsize:]
                 else:  # no new data...
                     remdata = ""
             else:  # TODO(jbjohnso) what if remote sequence number is wrong??
                 self.remseq = newseq
             self.lastsize = remdatalen
-            ackpayload = bytearray((0, self.remseq, remdatalen, flag))
+            ackpayload = _sol_header.pack(0, self.remseq, remdatalen, flag)
             # Why not put pending data into the ack? because it's rare
             # and might be hard to decide what to do in the context of
             # retry situation
@@ -505,7 +585,7 @@ class ServerConsole(Console):
                 # if the session is broken, then close the SOL session
                 self.close()
             if remdata:  # Do not subject callers to empty data
-                self._print_data(remdata)
+                self._print_data(bytes(remdata))
         if self.myseq != 0 and ackseq == self.myseq:  # the bmc has something
             # to say about last xmit
             self.awaitingack = False
@@ -513,10 +593,11 @@ class ServerConsole(Console):
                 newtext = self.lastpayload[4 + ackcount:]
                 with self.outputlock:
                     if (self.pendingoutput
-                            and not isinstance(self.pendingoutput[0], dict)):
-                        self.pendingoutput[0] = newtext + self.pendingoutput[0]
+                            and self.pendingoutput[0][0] == _PENDING_TEXT):
+                        newtext.extend(self.pendingoutput[0][1])
+                        self.pendingoutput[0] = (_PENDING_TEXT, newtext)
                     else:
-                        self.pendingoutput = [newtext] + self.pendingoutput
+                        self.pendingoutput.appendleft((_PENDING_TEXT, newtext))
             # self._sendpendingoutput() checks len(self._sendpendingoutput)
             self._sendpendingoutput()
         elif ackseq != 0 and self.awaitingack:
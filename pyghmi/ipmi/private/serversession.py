@@ -69,6 +69,7 @@ class ServerSession(ipmisession.Session):
         self.servermode = True
         self.ipmiversion = 2.0
         self.sequencenumber = 0
+        self.remseqnumber = None
         self.sessionid = 0
         self.bmc = bmc
         self.lastpayload = None
@@ -80,8 +81,8 @@ class ServerSession(ipmisession.Session):
         self.kg = kg
         self.socket = netsocket
         self.sockaddr = clientaddr
-        self.pendingpayloads = collections.deque([])
-        self.pktqueue = collections.deque([])
+        self.pendingpayloads = collections.deque()
+        self.pktqueue = collections.deque()
         if clientaddr not in ipmisession.Session.bmc_handlers:
             ipmisession.Session.bmc_handlers[clientaddr] = {bmc.port: self}
         else:
@@ -92,8 +93,7 @@ class ServerSession(ipmisession.Session):
                           retry=False)
 
     def _got_rmcp_openrequest(self, data):
-        response = self.create_open_session_response(
-            struct.pack('B' * len(data), *data))
+        response = self.create_open_session_response(bytes(data))
         self.send_payload(response,
                           constants.payload_types['rmcpplusopenresponse'],
                           retry=False)
@@ -147,16 +147,14 @@ class ServerSession(ipmisession.Session):
                             bytes(RmRc)
                             + struct.pack("2B", self.rolem, len(self.username))
                             + self.username, hashlib.sha1).digest()
-        self.k1 = hmac.new(self.sik, b'\x01' * 20, hashlib.sha1).digest()
-        self.k2 = hmac.new(self.sik, b'\x02' * 20, hashlib.sha1).digest()
-        self.aeskey = self.k2[0:16]
+        self._derive_session_keys()
         hmacdata = (self.Rc + self.clientsessionid
                     + struct.pack("2B", self.rolem, len(self.username))
                     + self.username)
         expectedauthcode = hmac.new(self.kuid, bytes(hmacdata), hashlib.sha1
                                     ).digest()
-        authcode = struct.pack("%dB" % len(data[8:]), *data[8:])
-        if expectedauthcode != authcode:
+        authcode = bytes(data[8:])
+        if not hmac.compare_digest(expectedauthcode, authcode):
             # TODO(jjohnson2): RMCP error back at invalid rakp3
             return
         clienttag = data[0]
@@ -191,8 +189,10 @@ class ServerSession(ipmisession.Session):
         payload = bytearray(
             [tagvalue, statuscode, 0, 0]) + self.clientsessionid
         hmacdata = self.Rm + self.managedsessionid + self.uuiddata
-        hmacdata = struct.pack('%dB' % len(hmacdata), *hmacdata)
-        authdata = hmac.new(self.sik, hmacdata, hashlib.sha1).digest()[:12]
+        hmacdata = bytes(hmacdata)
+        authdata = self.sikhmac.copy()
+        authdata.update(hmacdata)
+        authdata = authdata.digest()[:12]
         payload += authdata
         self.send_payload(payload, constants.payload_types['rakp4'],
                           retry=False)
@@ -256,7 +256,7 @@ class IpmiServer(object):
         self.additionaldevices = 0
         self.mfgid = 0
         self.prodid = 0
-        self.pktqueue = collections.deque([])
+        self.pktqueue = collections.deque()
         if bmcuuid is None:
             self.uuid = uuid.uuid4()
         else:
@@ -282,12 +282,11 @@ class IpmiServer(object):
         header = bytearray(
             b'\x06\x00\xff\x07\x00\x00\x00\x00\x00\x00\x00\x00\x00\x10')
         headerdata = [clientaddr, clientlun | (7 << 2)]
-        headersum = ipmisession._checksum(*headerdata)
+        headersum = ipmisession._checksum(headerdata)
         header += bytearray(headerdata + [headersum, myaddr,
                                           mylun | (clientseq << 2), 0x38])
         header += self.authcap
-        bodydata = struct.unpack('B' * len(header[17:]), bytes(header[17:]))
-        header.append(ipmisession._checksum(*bodydata))
+        header.append(ipmisession._checksum(header[17:]))
         ipmisession._io_sendto(self.serversocket, header, sockaddr)
 
     def process_pktqueue(self):
@@ -306,12 +305,12 @@ class IpmiServer(object):
         # now the generic inner ipmi packet, per figure-13-4,
         # ipmi lan message formats
         ipmihdr = bytearray([clientaddr, clientlun | (7 << 2)])
-        hdrsum = ipmisession._checksum(*ipmihdr)
+        hdrsum = ipmisession._checksum(ipmihdr)
         ipmihdr.append(hdrsum)
         rq = bytearray([myaddr, mylun | clientseq << 2, 0x54])
         # for now, hard code a cipher suite 3 only response
         rq.extend(bytearray(b'\x00\x01\xc0\x03\x01\x41\x81'))
-        hdrsum = ipmisession._checksum(*rq)
+        hdrsum = ipmisession._checksum(rq)
         rq.append(hdrsum)
         pkt = header + ipmihdr + rq
         ipmisession._io_sendto(self.serversocket, pkt, sockaddr)
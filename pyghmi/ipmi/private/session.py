@@ -18,6 +18,8 @@
 import collections
 import hashlib
 import hmac
+import itertools
+import math
 import operator
 import os
 import random
@@ -42,15 +44,6 @@ KEEPALIVE_SESSIONS = threading.RLock()
 WAITING_SESSIONS = threading.RLock()
 
 
-try:
-    dict.iteritems
-
-    def dictitems(d):
-        return d.iteritems()
-except AttributeError:
-    def dictitems(d):
-        return d.items()
-
 # minimum timeout for first packet to retry in any given
 # session.  This will be randomized to stagger out retries
 # in case of congestion
@@ -67,7 +60,7 @@ iothread = None
 iothreadready = False
 # threads waiting for iothreadready
 iothreadwaiters = []
-ioqueue = collections.deque([])
+ioqueue = collections.deque()
 myself = None
 ipv6support = None
 selectdeadline = 0
@@ -106,6 +99,14 @@ def define_worker():
             iowaiters = []
             directediowaiters = {}
             timeout = 300
+            # epoll lets one wakeup report just the sockets with data rather
+            # than rescanning every socket.  eventlet removes epoll from its
+            # green select, in which case fall back to select()
+            if hasattr(select, 'epoll'):
+                poller = select.epoll()
+            else:
+                poller = None
+            pollsockets = {}
             iothreadready = True
             while iothreadwaiters:
                 waiter = iothreadwaiters.pop()
@@ -114,14 +115,23 @@ def define_worker():
                 if timeout < 0:
                     timeout = 0
                 selectdeadline = _monotonic_time() + timeout
-                select.select(iosockets, (), (), timeout)
+                if poller is None:
+                    readysockets = select.select(
+                        iosockets, (), (), timeout)[0]
+                else:
+                    # iosockets is only ever appended to, register newcomers
+                    for mysocket in iosockets[len(pollsockets):]:
+                        pollsockets[mysocket.fileno()] = mysocket
+                        poller.register(mysocket, select.EPOLLIN)
+                    readysockets = [
+                        pollsockets[fd] for fd, _ in poller.poll(timeout)]
                 # pessimistically move out the deadline
                 # doing it this early (before ioqueue is evaluated)
                 # this avoids other threads making a bad assumption
                 # about not having to break into the select
                 selectdeadline = _monotonic_time() + 300
                 timeout = 300
-                sockaddrs = _io_graball(iosockets, directediowaiters)
+                sockaddrs = _io_graball(readysockets, directediowaiters)
                 for w in iowaiters:
                     w[1].set()
                 iowaiters = []
@@ -164,7 +174,7 @@ def define_worker():
     return _IOWorker
 
 
-sessionqueue = collections.deque([])
+sessionqueue = collections.deque()
 
 
 def _io_wait(timeout, myaddr=None, evq=None):
@@ -186,11 +196,20 @@ def _io_wait(timeout, myaddr=None, evq=None):
     evt.wait()
 
 
+# Where recvfrom can be asked not to block, sockets stay in blocking mode
+# for good rather than flipping modes (two fcntl calls each time) around
+# every send and receive.  eventlet green sockets keep their own idea of
+# blocking, so they are still switched explicitly
+_MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0)
+
+
 def _io_sendto(mysocket, packet, sockaddr):
     # Want sendto to act reasonably sane..
-    mysocket.setblocking(1)
     if hasattr(mysocket, 'fd'):
+        mysocket.setblocking(1)
         mysocket = mysocket.fd
+    elif not _MSG_DONTWAIT:
+        mysocket.setblocking(1)
     try:
         mysocket.sendto(packet, sockaddr)
     except Exception:
@@ -200,6 +219,7 @@ def _io_sendto(mysocket, packet, sockaddr):
 def _io_graball(mysockets, iowaiters):
     sockaddrs = []
     for mysocket in mysockets:
+        myport = mysocket.getsockname()[1]
         while True:
             rdata = _io_recvfrom(mysocket, 3000)
             if rdata is None:
@@ -210,7 +230,6 @@ def _io_graball(mysockets, iowaiters):
             # into the select
             if len(rdata[0]) < 4:
                 continue
-            myport = mysocket.getsockname()[1]
             rdata = rdata + (mysocket,)
             relsession = None
             if (rdata[1] in Session.bmc_handlers
@@ -234,11 +253,19 @@ def _io_graball(mysockets, iowaiters):
 
 
 def _io_recvfrom(mysocket, size):
-    mysocket.setblocking(0)
+    # Receive straight into a bytearray, the mutable form the packet
+    # handlers work on, rather than into bytes to be copied later
+    buf = bytearray(size)
     try:
-        return mysocket.recvfrom(size)
+        if _MSG_DONTWAIT and not hasattr(mysocket, 'fd'):
+            nbytes, addr = mysocket.recvfrom_into(buf, size, _MSG_DONTWAIT)
+        else:
+            mysocket.setblocking(0)
+            nbytes, addr = mysocket.recvfrom_into(buf)
     except socket.error:
         return None
+    del buf[nbytes:]
+    return buf, addr
 
 
 try:
@@ -256,31 +283,147 @@ def _poller(timeout=0):
     return sessionqueue
 
 
+# constant IPMI RMCP header
+_RMCP_HEADER = b'\x06\x00\xff\x07'
+# little endian 32 bit fields (session ids, sequence numbers) in headers
+_U32 = struct.Struct('<I')
+# session id and session sequence number as they appear in session headers
+_U32U32 = struct.Struct('<II')
+
+# payload types that may be sent in an IPMI 2.0 session header
+_VALID_PAYLOAD_TYPES = frozenset(constants.payload_types.values())
+
+# Authentication, integrity and confidentiality algorithm payloads offered
+# in an RMCP+ open session request (table 13-17)
+_RMCPPLUS_ALGORITHMS_SHA1 = bytes([
+    0, 0, 0, 8, 1, 0, 0, 0,  # RAKP-HMAC-SHA1
+    1, 0, 0, 8, 1, 0, 0, 0,  # SHA-1 integrity
+    2, 0, 0, 8, 1, 0, 0, 0,  # AES privacy
+    # 2,0,0,8,0,0,0,0, #no privacy confalgo
+])
+_RMCPPLUS_ALGORITHMS_SHA256 = bytes([
+    0, 0, 0, 8, 3, 0, 0, 0,  # RAKP-HMAC-SHA256
+    1, 0, 0, 8, 4, 0, 0, 0,  # SHA-256-128 integrity
+    2, 0, 0, 8, 1, 0, 0, 0,  # AES privacy
+    # 2,0,0,8,0,0,0,0, #no privacy confalgo
+])
+
+# Session methods handling the RMCP+ session setup payload types.  These
+# are looked up by name so that ServerSession's versions take effect
+_RMCPPLUS_HANDLERS = {
+    0x10: '_got_rmcp_openrequest',
+    0x11: '_got_rmcp_response',
+    0x12: '_got_rakp1',
+    0x13: '_got_rakp2',
+    0x14: '_got_rakp3',
+    0x15: '_got_rakp4',
+}
+
+# IPMI 1.5 packet lengths that must carry a legacy pad byte
+_LEGACY_PAD_TOTLENS = frozenset((56, 84, 112, 128, 156))
+
+# RMCP+ integrity trailers, indexed by the number of pad bytes needed to
+# align the packet: the 0xff pad, the pad length and the reserved next
+# header field, which is required to be 7
+_INTEGRITY_PAD_TABLE = tuple(b'\xff' * n + bytearray((n, 7))
+                             for n in range(4))
+
+# AES-CBC pad tails per table 13-20, indexed by the number of pad bytes.
+# Each is the pad bytes 1..n followed by the pad length field itself
+_PAD_TABLE = tuple(bytes(bytearray(range(1, n + 1)) + bytearray((n,)))
+                   for n in range(16))
+
+
+def _pad_len(psize):
+    """Number of AES-CBC pad bytes needed for a payload of psize bytes
+
+    The pad length field itself is counted, and the total is padded up to
+    the next multiple of 16 (which may be no pad at all).
+    """
+    return -(psize + 1) & 15
+
+
 def _aespad(data):
     """ipmi demands a certain pad scheme, per table 13-20 AES-CBC encrypted
 
     payload fields.
     """
-    currlen = len(data) + 1  # need to count the pad length field as well
-    neededpad = currlen % 16
-    if neededpad:  # if it happens to be zero, hurray, but otherwise invert the
-        # sense of the padding
-        neededpad = 16 - neededpad
-    padval = 1
-    pad = bytearray(neededpad)
-    while padval <= neededpad:
-        pad[padval - 1] = padval
-        padval += 1
-    pad.append(neededpad)
-    return pad
-
-
-def _checksum(*data):  # Two's complement over the data
-    csum = sum(data)
-    csum ^= 0xff
-    csum += 1
-    csum &= 0xff
-    return csum
+    return _PAD_TABLE[_pad_len(len(data))]
+
+
+def _checksum(data):  # Two's complement over the data
+    return -sum(data) & 0xff
+
+
+class _AesCbc(object):
+    """AES-CBC encryption with a key schedule kept across packets
+
+    IPMI encrypts every payload with a fresh IV, and setting up a new cipher
+    for each packet costs more than encrypting the few blocks it holds.
+    Instead a single CBC context is kept running and each packet is spliced
+    into its chain.  CBC mixes the previous ciphertext block into the next
+    block, so xoring the first plaintext block with both the desired IV and
+    the previous ciphertext block produces exactly what a fresh context
+    with that IV would.  Decryption works the same way in reverse, with a
+    context of its own.
+
+    :param key: The AES key for the session
+    """
+
+    def __init__(self, key):
+        self.lock = threading.Lock()
+        cipher = Cipher(
+            algorithm=algorithms.AES(key),
+            mode=modes.CBC(b'\x00' * 16),
+            backend=default_backend()
+        )
+        self.encryptor = cipher.encryptor()
+        self.decryptor = cipher.decryptor()
+        self.lastblock = 0
+        self.lastdecrypted = 0
+        self.ivpool = b''
+        self.ivoffset = 0
+
+    def nextiv(self):
+        """Return a fresh random IV
+
+        IVs are carved out of a larger block of random data so that the
+        kernel is asked for randomness once every 64 packets rather than
+        for every packet.
+        """
+        with self.lock:
+            if self.ivoffset >= len(self.ivpool):
+                self.ivpool = os.urandom(1024)
+                self.ivoffset = 0
+            iv = self.ivpool[self.ivoffset:self.ivoffset + 16]
+            self.ivoffset += 16
+        return iv
+
+    def encrypt(self, iv, data):
+        """Encrypt data already padded to the AES block size"""
+        with self.lock:
+            first = (int.from_bytes(data[:16], 'big')
+                     ^ int.from_bytes(iv, 'big') ^ self.lastblock)
+            encrypted = self.encryptor.update(
+                first.to_bytes(16, 'big') + bytes(data[16:]))
+            self.lastblock = int.from_bytes(encrypted[-16:], 'big')
+        return encrypted
+
+    def decrypt(self, iv, data):
+        """Decrypt data into a bytearray, or None if not whole AES blocks
+
+        Anything but whole blocks would leave a partial block buffered in
+        the shared context and garble every later packet.
+        """
+        if not data or len(data) % 16:
+            return None
+        with self.lock:
+            decrypted = bytearray(self.decryptor.update(data))
+            first = (int.from_bytes(decrypted[:16], 'big')
+                     ^ int.from_bytes(iv, 'big') ^ self.lastdecrypted)
+            self.lastdecrypted = int.from_bytes(data[-16:], 'big')
+        decrypted[:16] = first.to_bytes(16, 'big')
+        return decrypted
 
 
 class Session(object):
@@ -304,6 +447,8 @@ class Session(object):
     :param port: UDP port to communicate with, pretty much always 623
     :param onlogon: callback to receive notification of login completion
     """
+    # The following containers are deliberately class level, they are the
+    # registry shared by every Session and must never be rebound per instance
     bmc_handlers = {}
     waiting_sessions = {}
     initting_sessions = {}
@@ -316,6 +461,9 @@ class Session(object):
     # this will be a lock.  Delay the assignment so that a calling framework
     # can do something like reassign our threading and select modules
     socketchecking = None
+    # source of custom keepalive registration ids, never reused so there
+    # is no need to check for collisions.  Starts at 1 to keep ids truthy
+    _keepalive_regids = itertools.count(1)
 
     # Maintain single Cryptography backend for all IPMI sessions (seems to be
     # thread-safe)
@@ -342,7 +490,7 @@ class Session(object):
         # slots to be recycled
         sorted_candidates = None
         if server is None:
-            sorted_candidates = sorted(dictitems(cls.socketpool),
+            sorted_candidates = sorted(cls.socketpool.items(),
                                        key=operator.itemgetter(1))
         if sorted_candidates is None:
             sorted_candidates = []
@@ -382,6 +530,9 @@ class Session(object):
             cls.socketpool[tmpsocket] = 1
         else:
             tmpsocket.bind(server[4])
+        # Pin the socket to blocking mode whatever the default timeout, as
+        # _io_sendto and _io_recvfrom only switch modes where they have to
+        tmpsocket.setblocking(1)
         iosockets.append(tmpsocket)
         if myself is None:
             # we have confirmed kernel IPv6 support, but ::1 may still not
@@ -441,7 +592,7 @@ class Session(object):
                 newhost = '::ffff:' + sockaddr[0]
                 sockaddr = (newhost, sockaddr[1], 0, 0)
             if sockaddr in cls.bmc_handlers:
-                for portself in list(dictitems(cls.bmc_handlers[sockaddr])):
+                for portself in list(cls.bmc_handlers[sockaddr].items()):
                     self = portself[1]
                     if not ((self.logged or self.logging)
                             and cls._is_session_valid(self)):
@@ -519,11 +670,11 @@ class Session(object):
         self.lastpayload = None
         self._customkeepalives = None
         # queue of events denoting line to run a cmd
-        self.evq = collections.deque([])
+        self.evq = collections.deque()
         self.bmc = bmc
         # a private queue for packets for which this session handler
         # is destined to receive
-        self.pktqueue = collections.deque([])
+        self.pktqueue = collections.deque()
 
         try:
             self.userid = userid.encode('utf-8')
@@ -531,9 +682,12 @@ class Session(object):
         except AttributeError:
             self.userid = userid
             self.password = password
+        # password null padded to 16 bytes, set up on first ipmi 1.5 use
+        self.ipmi15password = None
+        self.ipmi15md5 = None
         self.nowait = False
-        self.pendingpayloads = collections.deque([])
-        self.request_entry = []
+        self.pendingpayloads = collections.deque()
+        self.request_entry = set()
         self.kgo = kg
         if kg is not None:
             try:
@@ -615,11 +769,13 @@ class Session(object):
         self.remseqnumber = None
         self.confalgo = 0
         self.aeskey = None
+        self.aescbc = None
         self.integrityalgo = 0
         self.attemptedhash = 256
         self.currhashlib = None
         self.currhashlen = 0
         self.k1 = None
+        self.k1hmac = None
         self.rmcptag = 1
         self.lastpayload = None
         self.ipmicallback = None
@@ -661,16 +817,17 @@ class Session(object):
         """
         # NOTE(puwen): need to pay attention for this function because the
         # structure does not seem to match the specifications.
-        head = bytearray((constants.IPMI_BMC_ADDRESS,
-                          constants.netfn_codes['application'] << 2))
-        check_sum = _checksum(*head)
+        head = (constants.IPMI_BMC_ADDRESS,
+                constants.netfn_codes['application'] << 2)
         # NOTE(fengqian): according IPMI Figure 14-11, rqSWID is set to 81h
-        boday = bytearray((0x81, (self.seqlun << 2) | self.rqlun,
-                           constants.IPMI_SEND_MESSAGE_CMD, 0x40 | channel))
+        msg = bytearray(head + (_checksum(head), 0x81,
+                                (self.seqlun << 2) | self.rqlun,
+                                constants.IPMI_SEND_MESSAGE_CMD,
+                                0x40 | channel))
         # NOTE(fengqian): Track request
         self._add_request_entry((constants.netfn_codes['application'] + 1,
                                  self.seqlun, constants.IPMI_SEND_MESSAGE_CMD))
-        return head + bytearray((check_sum,)) + boday
+        return msg
 
     def _add_request_entry(self, entry=()):
         """This function record the request with netfn, sequence number and
@@ -678,15 +835,13 @@ class Session(object):
         command, which will be used in parse_ipmi_payload.
         :param entry: a set of netfn, sequence number and command.
         """
-        if not self._lookup_request_entry(entry):
-            self.request_entry.append(entry)
+        self.request_entry.add(entry)
 
     def _lookup_request_entry(self, entry=()):
         return entry in self.request_entry
 
     def _remove_request_entry(self, entry=()):
-        if self._lookup_request_entry(entry):
-            self.request_entry.remove(entry)
+        self.request_entry.discard(entry)
 
     def _make_ipmi_payload(self, netfn, command, bridge_request=None, data=(),
                            rslun=0):
@@ -728,17 +883,26 @@ class Session(object):
         # figure 13-4, first two bytes are rsaddr and
         # netfn, for non-bridge request, rsaddr is always 0x20 since we are
         # addressing BMC while rsaddr is specified forbridge request
-        header = bytearray((rsaddr, (netfn << 2) | rslun))
-        reqbody = bytearray(
-            (rqaddr, (self.seqlun << 2) | self.rqlun, command)) + data
-        headsum = bytearray((_checksum(*header),))
-        bodysum = bytearray((_checksum(*reqbody),))
-        payload = header + headsum + reqbody + bodysum
+        # The whole payload is laid out in one buffer: any bridge message,
+        # header, header checksum, request body with data, body checksum
+        # and, for bridge requests, a trailing checksum
+        hdroff = len(bridge_msg)
+        bodyend = hdroff + 6 + len(data)
+        payload = bytearray(bodyend + (2 if bridge_request else 1))
+        payload[:hdroff] = bridge_msg
+        payload[hdroff] = rsaddr
+        payload[hdroff + 1] = (netfn << 2) | rslun
+        payload[hdroff + 2] = -(rsaddr + payload[hdroff + 1]) & 0xff
+        payload[hdroff + 3] = rqaddr
+        payload[hdroff + 4] = (self.seqlun << 2) | self.rqlun
+        payload[hdroff + 5] = command
+        payload[hdroff + 6:bodyend] = data
+        view = memoryview(payload)
+        payload[bodyend] = _checksum(view[hdroff + 3:bodyend])
         if bridge_request:
-            payload = bridge_msg + payload
             # NOTE(fengqian): For bridge request, another check sum is needed.
-            tail_csum = _checksum(*payload[3:])
-            payload.append(tail_csum)
+            payload[-1] = _checksum(view[3:-1])
+        view.release()
 
         if not self.servermode:
             self._add_request_entry((self.expectednetfn, self.seqlun, command))
@@ -760,11 +924,11 @@ class Session(object):
         return 0
 
     def _getmaxtimeout(self):
-        cumulativetime = 0
-        incrementtime = self.timeout
-        while incrementtime < self.maxtimeout:
-            cumulativetime += incrementtime
-            incrementtime += 1
+        # retries wait timeout, timeout + 1, ... while below maxtimeout,
+        # so the total is an arithmetic series over that many retries
+        retries = max(0, math.ceil(self.maxtimeout - self.timeout))
+        cumulativetime = (retries * self.timeout
+                          + retries * (retries - 1) // 2)
         return (cumulativetime + 1) * (self.logontries + 1)
 
     def _cmdwait(self):
@@ -876,6 +1040,8 @@ class Session(object):
                      delay_xmit=None, needskeepalive=False, timeout=None):
         """Send payload over the IPMI Session
 
+        :param payload: The payload as a bytes-like object, usually the
+                        bytearray from _make_ipmi_payload
         :param needskeepalive: If the payload is expected not to count as
                                'active' by the BMC, set this to True
                                to avoid Session considering the
@@ -897,12 +1063,10 @@ class Session(object):
             payload_type = self.last_payload_type
         if not payload:
             payload = self.lastpayload
-        message = bytearray(b'\x06\x00\xff\x07')  # constant IPMI RMCP header
+        message = bytearray(_RMCP_HEADER)
         if retry:
             self.lastpayload = payload
             self.last_payload_type = payload_type
-        if not isinstance(payload, bytearray):
-            payload = bytearray(payload)
         message.append(self.authtype)
         baretype = payload_type
         if self.integrityalgo:
@@ -914,13 +1078,12 @@ class Session(object):
             if baretype == 2:
                 # TODO(jbjohnso): OEM payload types
                 raise NotImplementedError("OEM Payloads")
-            elif baretype not in constants.payload_types.values():
+            elif baretype not in _VALID_PAYLOAD_TYPES:
                 raise NotImplementedError(
                     "Unrecognized payload type %d" % baretype)
-            message += struct.pack("<I", self.sessionid)
-        message += struct.pack("<I", self.sequencenumber)
+            message += _U32U32.pack(self.sessionid, self.sequencenumber)
         if self.ipmiversion == 1.5:
-            message += struct.pack("<I", self.sessionid)
+            message += _U32U32.pack(self.sequencenumber, self.sessionid)
             if not self.authtype == 0:
                 message += self._ipmi15authcode(payload)
             message.append(len(payload))
@@ -928,51 +1091,32 @@ class Session(object):
             # Guessing the ipmi spec means the whole
             totlen = 34 + len(message)
             # packet and assume no tag in old 1.5 world
-            if totlen in (56, 84, 112, 128, 156):
+            if totlen in _LEGACY_PAD_TOTLENS:
                 message.append(0)  # Legacy pad as mandated by ipmi spec
         elif self.ipmiversion == 2.0:
             psize = len(payload)
             if self.confalgo:
-                pad = (psize + 1) % 16  # pad has to cope with one byte
-                # field like the _aespad function
-                if pad:  # if no pad needed, then we take no more action
-                    pad = 16 - pad
+                pad = _pad_len(psize)
                 # new payload size grew according to pad
                 newpsize = psize + pad + 17
                 # size, plus pad length, plus 16 byte IV
                 # (Table 13-20)
                 message.append(newpsize & 0xff)
                 message.append(newpsize >> 8)
-                iv = os.urandom(16)
+                iv = self.aescbc.nextiv()
                 message += iv
-                payloadtocrypt = bytes(payload + _aespad(payload))
-                crypter = Cipher(
-                    algorithm=algorithms.AES(self.aeskey),
-                    mode=modes.CBC(iv),
-                    backend=self._crypto_backend
-                )
-                encryptor = crypter.encryptor()
-                message += encryptor.update(payloadtocrypt
-                                            ) + encryptor.finalize()
+                payloadtocrypt = payload + _PAD_TABLE[pad]
+                message += self.aescbc.encrypt(iv, payloadtocrypt)
             else:  # no confidetiality algorithm
                 message.append(psize & 0xff)
                 message.append(psize >> 8)
                 message += payload
             if self.integrityalgo:  # see table 13-8,
                 # RMCP+ packet format
-                # TODO(jbjohnso): SHA256 which is now
-                # allowed
-                neededpad = (len(message) - 2) % 4
-                if neededpad:
-                    neededpad = 4 - neededpad
-                message += b'\xff' * neededpad
-                message.append(neededpad)
-                message.append(7)  # reserved, 7 is the required value for the
-                # specification followed
-                message += hmac.new(
-                    self.k1, bytes(message[4:]),
-                    self.currhashlib).digest()[:self.currhashlen]
-                # per RFC2404 truncates to 96 bits
+                message += _INTEGRITY_PAD_TABLE[-(len(message) - 2) & 3]
+                with memoryview(message) as view:
+                    authcode = self._integrity_code(view[4:])
+                message += authcode
         self.netpacket = message
         # advance idle timer since we don't need keepalive while sending
         # packets out naturally
@@ -983,26 +1127,43 @@ class Session(object):
                     _monotonic_time() + MAX_IDLE - (random.random() * 4.9)
             self._xmit_packet(retry, delay_xmit=delay_xmit, timeout=timeout)
 
+    def _integrity_code(self, data):
+        """Compute the RMCP+ integrity auth code over data
+
+        The keyed HMAC is set up once per session, so this only hashes
+        data, and truncates per RFC2404 (96 bits for SHA1).
+        """
+        integrity = self.k1hmac.copy()
+        integrity.update(data)
+        return integrity.digest()[:self.currhashlen]
+
     def _ipmi15authcode(self, payload, checkremotecode=False):
         # checkremotecode is used to verify remote code,
         # otherwise this function is used to general authcode for local
         if self.authtype == 0:
             # Only for things before auth in ipmi 1.5, not
             # like 2.0 cipher suite 0
-            return ()
-        password = self.password
-        padneeded = 16 - len(password)
-        if padneeded < 0:
-            raise exc.IpmiException("Password is too long for ipmi 1.5")
-        password += '\x00' * padneeded
+            return b''
+        password = self.ipmi15password
+        if password is None:
+            padneeded = 16 - len(self.password)
+            if padneeded < 0:
+                raise exc.IpmiException("Password is too long for ipmi 1.5")
+            password = self.password + b'\x00' * padneeded
+            self.ipmi15password = password
+            # the digest always opens with the padded password, so hash
+            # that prefix once and copy it for every packet
+            self.ipmi15md5 = hashlib.md5(password)
         if checkremotecode:
-            seqbytes = struct.pack("<I", self.remseqnumber)
+            seqbytes = _U32.pack(self.remseqnumber)
         else:
-            seqbytes = struct.pack("<I", self.sequencenumber)
-        sessdata = struct.pack("<I", self.sessionid)
-        bodydata = password + sessdata + payload + seqbytes + password
-        dgst = hashlib.md5(bodydata).digest()
-        return dgst
+            seqbytes = _U32.pack(self.sequencenumber)
+        dgst = self.ipmi15md5.copy()
+        dgst.update(_U32.pack(self.sessionid))
+        dgst.update(payload)
+        dgst.update(seqbytes)
+        dgst.update(password)
+        return dgst.digest()
 
     def _got_channel_auth_cap(self, response):
         if 'error' in response:
@@ -1039,7 +1200,7 @@ class Session(object):
             self.onlogon({'error': errstr})
             return
         data = response['data']
-        self.sessionid = struct.unpack("<I", bytes(data[0:4]))[0]
+        self.sessionid = _U32.unpack_from(data, 0)[0]
         self.authtype = 2
         self._activate_session(data[4:])
 
@@ -1059,8 +1220,8 @@ class Session(object):
             self.onlogon({'error': errstr})
             return
         data = response['data']
-        self.sessionid = struct.unpack("<I", bytes(data[1:5]))[0]
-        self.sequencenumber = struct.unpack("<I", bytes(data[5:9]))[0]
+        self.sessionid = _U32.unpack_from(data, 1)[0]
+        self.sequencenumber = _U32.unpack_from(data, 5)[0]
         self._req_priv_level()
 
     def _req_priv_level(self):
@@ -1117,25 +1278,15 @@ class Session(object):
             0,  # request as much privilege as the channel will give us
             0, 0,  # reserved
         ])
-        data += struct.pack("<I", self.localsid)
+        data += _U32.pack(self.localsid)
         # auth 3 sha256
         # integrity... 4 = sha256
         if self.attemptedhash == 1:
-            data += bytearray([
-                0, 0, 0, 8, 1, 0, 0, 0,  # table 13-17, SHA-1
-                1, 0, 0, 8, 1, 0, 0, 0,  # SHA-1 integrity
-                2, 0, 0, 8, 1, 0, 0, 0,  # AES privacy
-                # 2,0,0,8,0,0,0,0, #no privacy confalgo
-            ])
+            data += _RMCPPLUS_ALGORITHMS_SHA1
             self.currhashlib = hashlib.sha1
             self.currhashlen = 12
         else:
-            data += bytearray([
-                0, 0, 0, 8, 3, 0, 0, 0,  # table 13-17, SHA-256
-                1, 0, 0, 8, 4, 0, 0, 0,  # SHA-256-128 integrity
-                2, 0, 0, 8, 1, 0, 0, 0,  # AES privacy
-                # 2,0,0,8,0,0,0,0, #no privacy confalgo
-            ])
+            data += _RMCPPLUS_ALGORITHMS_SHA256
             self.currhashlib = hashlib.sha256
             self.currhashlen = 16
         self.sessioncontext = 'OPENSESSION'
@@ -1199,7 +1350,7 @@ class Session(object):
         # a deadline, will be honored
         if timeout != 0:
             with util.protect(WAITING_SESSIONS):
-                for session, parms in dictitems(cls.waiting_sessions):
+                for session, parms in cls.waiting_sessions.items():
                     if parms['timeout'] <= curtime:
                         timeout = 0  # exit after one guaranteed pass
                         break
@@ -1210,7 +1361,7 @@ class Session(object):
                     timeout = parms['timeout'] - curtime  # set new timeout
                     # value
             with util.protect(KEEPALIVE_SESSIONS):
-                for session, parms in dictitems(cls.keepalive_sessions):
+                for session, parms in cls.keepalive_sessions.items():
                     if parms['timeout'] <= curtime:
                         timeout = 0
                         break
@@ -1238,7 +1389,7 @@ class Session(object):
         sessionstodel = []
         sessionstokeepalive = []
         with util.protect(KEEPALIVE_SESSIONS):
-            for session, parms in dictitems(cls.keepalive_sessions):
+            for session, parms in cls.keepalive_sessions.items():
                 # if the session is busy inside a command, defer invoking
                 # keepalive until incommand is no longer the case
                 if parms['timeout'] < curtime and not session._isincommand():
@@ -1248,7 +1399,7 @@ class Session(object):
         for session in sessionstokeepalive:
             session._keepalive()
         with util.protect(WAITING_SESSIONS):
-            for session, parms in dictitems(cls.waiting_sessions):
+            for session, parms in cls.waiting_sessions.items():
                 if parms['timeout'] < curtime:  # timeout has expired, time to
                     # give up on it and trigger timeout
                     # response in the respective session
@@ -1276,12 +1427,10 @@ class Session(object):
 
         :returns: value to identify registration for unregister_keepalive
         """
-        regid = random.random()
+        regid = next(Session._keepalive_regids)
         if self._customkeepalives is None:
             self._customkeepalives = {regid: (cmd, callback)}
         else:
-            while regid in self._customkeepalives:
-                regid = random.random()
             self._customkeepalives[regid] = (cmd, callback)
         return regid
 
@@ -1315,14 +1464,12 @@ class Session(object):
         try:
             keptalive = False
             if self._customkeepalives:
-                kaids = list(self._customkeepalives.keys())
-                for keepalive in kaids:
-                    try:
-                        cmd, callback = self._customkeepalives[keepalive]
-                    except TypeError:
+                kaitems = list(self._customkeepalives.items())
+                for keepalive, (cmd, callback) in kaitems:
+                    if self._customkeepalives is None:
                         # raw_command made customkeepalives None
                         break
-                    except KeyError:
+                    if keepalive not in self._customkeepalives:
                         # raw command ultimately caused a keepalive to
                         # deregister
                         continue
@@ -1330,8 +1477,9 @@ class Session(object):
                         cmd()
                         continue
                     keptalive = True
-                    cmd['callback'] = self._keepalive_wrapper(callback)
-                    self.raw_command(**cmd)
+                    # cmd is left untouched, so registrants may share it
+                    self.raw_command(
+                        callback=self._keepalive_wrapper(callback), **cmd)
             if not keptalive:
                 if self.incommand:
                     # if currently in command, no cause to keepalive
@@ -1346,8 +1494,7 @@ class Session(object):
 
     def process_pktqueue(self):
         while self.pktqueue:
-            pkt = list(self.pktqueue.popleft())
-            pkt[0] = bytearray(pkt[0])
+            pkt = self.pktqueue.popleft()
             if not (pkt[0][0] == 6 and pkt[0][2:4] == b'\xff\x07'):
                 continue
             # this should be in specific context, no need to check port
@@ -1368,8 +1515,8 @@ class Session(object):
             # things off ignore the second reply since we have one
             # satisfactory answer
         if data[4] in (0, 2):  # This is an ipmi 1.5 paylod
-            remseqnumber = struct.unpack('<I', bytes(data[5:9]))[0]
-            remsessid = struct.unpack("<I", bytes(data[9:13]))[0]
+            remseqnumber = _U32.unpack_from(data, 5)[0]
+            remsessid = _U32.unpack_from(data, 9)[0]
             if (remseqnumber == 0 and remsessid == 0
                     and qent[2] in Session.bmc_handlers):
                 # So a new ipmi client happens to get a previously seen and
@@ -1380,7 +1527,7 @@ class Session(object):
                 iserver.pktqueue.append(qent)
                 iserver.process_pktqueue()
                 return
-            if (hasattr(self, 'remseqnumber') and self.remseqnumber is not None
+            if (self.remseqnumber is not None
                     and remseqnumber < self.remseqnumber):
                 return -5  # remote sequence number is too low, reject it
             self.remseqnumber = remseqnumber
@@ -1401,7 +1548,7 @@ class Session(object):
             if authcode:
                 expectedauthcode = self._ipmi15authcode(payload,
                                                         checkremotecode=True)
-                if expectedauthcode != authcode:
+                if not hmac.compare_digest(expectedauthcode, authcode):
                     return
             self._parse_ipmi_payload(payload)
         elif data[4] == 6:
@@ -1424,18 +1571,9 @@ class Session(object):
         ptype = data[5] & 0b00111111
         # the first 16 bytes are header information as can be seen in 13-8 that
         # we will toss out
-        if ptype == 0x10:
-            return self._got_rmcp_openrequest(data[16:])
-        elif ptype == 0x11:  # rmcp+ response
-            return self._got_rmcp_response(data[16:])
-        elif ptype == 0x12:
-            return self._got_rakp1(data[16:])
-        elif ptype == 0x13:
-            return self._got_rakp2(data[16:])
-        elif ptype == 0x14:
-            return self._got_rakp3(data[16:])
-        elif ptype == 0x15:
-            return self._got_rakp4(data[16:])
+        handler = _RMCPPLUS_HANDLERS.get(ptype)
+        if handler is not None:
+            return getattr(self, handler)(data[16:])
         elif ptype == 0 or ptype == 1:  # good old ipmi payload or sol
             # If endorsing a shared secret scheme, then at the very least it
             # needs to do mutual assurance
@@ -1446,37 +1584,36 @@ class Session(object):
             encrypted = 0
             if data[5] & 0b10000000:
                 encrypted = 1
-            authcode = data[-self.currhashlen:]
+            hashlen = self.currhashlen
             if self.k1 is None:  # we are in no shape to process a packet now
                 return
-            expectedauthcode = hmac.new(
-                self.k1, data[4:-self.currhashlen],
-                self.currhashlib).digest()[:self.currhashlen]
-            if authcode != expectedauthcode:
-                return  # BMC failed to assure integrity to us, drop it
-            sid = struct.unpack("<I", bytes(data[6:10]))[0]
+            # cheap checks first, so stray packets cost no HMAC
+            if len(data) < 16 + hashlen:  # too short to hold an auth code
+                return
+            sid = _U32.unpack_from(data, 6)[0]
             if sid != self.localsid:  # session id mismatch, drop it
                 return
-            remseqnumber = struct.unpack("<I", bytes(data[10:14]))[0]
-            if (hasattr(self, 'remseqnumber') and self.remseqnumber is not None
+            authcode = data[-hashlen:]
+            with memoryview(data) as view:
+                expectedauthcode = self._integrity_code(view[4:-hashlen])
+            if not hmac.compare_digest(authcode, expectedauthcode):
+                return  # BMC failed to assure integrity to us, drop it
+            remseqnumber = _U32.unpack_from(data, 10)[0]
+            if (self.remseqnumber is not None
                     and (remseqnumber < self.remseqnumber)
                     and (self.remseqnumber != 0xffffffff)):
                 return
             self.remseqnumber = remseqnumber
             psize = data[14] + (data[15] << 8)
-            payload = data[16:16 + psize]
             if encrypted:
-                iv = data[16:32]
-                crypter = Cipher(
-                    algorithm=algorithms.AES(self.aeskey),
-                    mode=modes.CBC(bytes(iv)),
-                    backend=self._crypto_backend
-                )
-                decryptor = crypter.decryptor()
-                payload = bytearray(decryptor.update(bytes(payload[16:])
-                                                     ) + decryptor.finalize())
-                padsize = payload[-1] + 1
-                payload = payload[:-padsize]
+                with memoryview(data) as view:
+                    payload = self.aescbc.decrypt(view[16:32],
+                                                  view[32:16 + psize])
+                if payload is None:
+                    return  # not whole AES blocks, drop it
+                del payload[-(payload[-1] + 1):]  # strip pad and pad length
+            else:
+                payload = data[16:16 + psize]
             if ptype == 0:
                 self._parse_ipmi_payload(payload)
             elif ptype == 1:  # There should be no other option
@@ -1523,10 +1660,10 @@ class Session(object):
         # shall be used.  As such, the allowedpriv field is actually
         # not particularly useful.  got_rakp2 is a good place to
         # gracefully detect and downgrade privilege for retry
-        localsid = struct.unpack("<I", bytes(data[4:8]))[0]
+        localsid = _U32.unpack_from(data, 4)[0]
         if self.localsid != localsid:
             return -9
-        self.pendingsessionid = struct.unpack("<I", bytes(data[8:12]))[0]
+        self.pendingsessionid = _U32.unpack_from(data, 8)[0]
         # TODO(jbjohnso): currently, we take it for granted that the responder
         # accepted our integrity/auth/confidentiality proposal
         self.lastpayload = None
@@ -1537,7 +1674,7 @@ class Session(object):
         self.randombytes = os.urandom(16)
         userlen = len(self.userid)
         payload = bytearray([self.rmcptag, 0, 0, 0]) + \
-            struct.pack("<I", self.pendingsessionid) + \
+            _U32.pack(self.pendingsessionid) + \
             self.randombytes +\
             bytearray([self.nameonly | self.privlevel, 0, 0, userlen]) + \
             self.userid
@@ -1570,26 +1707,31 @@ class Session(object):
                 errstr = "Unrecognized RMCP code %d" % data[1]
             self.onlogon({'error': errstr + " in RAKP2"})
             return -9
-        localsid = struct.unpack("<I", bytes(data[4:8]))[0]
+        localsid = _U32.unpack_from(data, 4)[0]
         if localsid != self.localsid:
             return -9  # discard mismatch in the session identifier
         self.remoterandombytes = bytes(data[8:24])
         self.remoteguid = bytes(data[24:40])
-        userlen = len(self.userid)
-        hmacdata = (struct.pack("<II", localsid, self.pendingsessionid)
+        # requested role and username length, both of which go into the
+        # RAKP2 auth code and the SIK
+        roleuser = bytes((self.nameonly | self.privlevel,
+                          len(self.userid))) + self.userid
+        hmacdata = (_U32U32.pack(localsid, self.pendingsessionid)
                     + self.randombytes + self.remoterandombytes
-                    + self.remoteguid + struct.pack(
-                    "2B", self.nameonly | self.privlevel, userlen)
-                    + self.userid)
+                    + self.remoteguid + roleuser)
         try:
-            expectedhash = hmac.new(self.password, hmacdata,
-                                    self.currhashlib).digest()
+            # keyed once for both the RAKP2 check and the RAKP3 auth code
+            self.passwordhmac = hmac.new(self.password,
+                                         digestmod=self.currhashlib)
+            expectedhash = self.passwordhmac.copy()
+            expectedhash.update(hmacdata)
+            expectedhash = expectedhash.digest()
         except TypeError:
             print('Password for {0} is somehow malformed'.format(self.bmc))
             return -9
         hashlen = len(expectedhash)
-        givenhash = struct.pack("%dB" % hashlen, *data[40:hashlen + 40])
-        if givenhash != expectedhash:
+        givenhash = bytes(data[40:hashlen + 40])
+        if not hmac.compare_digest(givenhash, expectedhash):
             self.sessioncontext = "FAILED"
             self.onlogon({'error': "Incorrect password provided"})
             return -9
@@ -1597,29 +1739,44 @@ class Session(object):
         # to store the keys
         self.sik = hmac.new(self.kg,
                             self.randombytes + self.remoterandombytes
-                            + struct.pack(
-                                "2B", self.nameonly | self.privlevel, userlen)
-                            + self.userid, self.currhashlib).digest()
-        self.k1 = hmac.new(self.sik, b'\x01' * 20, self.currhashlib).digest()
-        self.k2 = hmac.new(self.sik, b'\x02' * 20, self.currhashlib).digest()
-        self.aeskey = self.k2[0:16]
+                            + roleuser, self.currhashlib).digest()
+        self._derive_session_keys()
         self.sessioncontext = "EXPECTINGRAKP4"
         self.lastpayload = None
         self._send_rakp3()
 
+    def _derive_session_keys(self):
+        """Derive the integrity and AES keys from the SIK
+
+        k1 and k2 are both HMACs keyed by the SIK, so the SIK is keyed once
+        and copied for each (and for the RAKP4 integrity check value).
+        """
+        self.sikhmac = hmac.new(self.sik, digestmod=self.currhashlib)
+        k1 = self.sikhmac.copy()
+        k1.update(b'\x01' * 20)
+        self.k1 = k1.digest()
+        # keyed once here and copied per packet, to skip redoing the key
+        # setup for every integrity check value
+        self.k1hmac = hmac.new(self.k1, digestmod=self.currhashlib)
+        k2 = self.sikhmac.copy()
+        k2.update(b'\x02' * 20)
+        self.k2 = k2.digest()
+        self.aeskey = self.k2[0:16]
+        self.aescbc = _AesCbc(self.aeskey)
+
     def _send_rakp3(self):  # rakp message 3
         self.rmcptag += 1
         # rmcptag, then status 0, then two reserved 0s
-        payload = [self.rmcptag, 0, 0, 0] +\
-            list(struct.unpack("4B", struct.pack("<I", self.pendingsessionid)))
+        payload = bytearray((self.rmcptag, 0, 0, 0))
+        payload += _U32.pack(self.pendingsessionid)
         hmacdata = self.remoterandombytes +\
-            struct.pack("<I", self.localsid) +\
-            struct.pack("2B", self.nameonly | self.privlevel,
-                        len(self.userid)) +\
+            _U32.pack(self.localsid) +\
+            bytes((self.nameonly | self.privlevel, len(self.userid))) +\
             self.userid
 
-        authcode = hmac.new(self.password, hmacdata, self.currhashlib).digest()
-        payload += list(struct.unpack("%dB" % len(authcode), authcode))
+        authcode = self.passwordhmac.copy()
+        authcode.update(hmacdata)
+        payload += authcode.digest()
         self.send_payload(
             payload=payload, payload_type=constants.payload_types['rakp3'])
 
@@ -1649,17 +1806,18 @@ class Session(object):
                 errstr = "Unrecognized RMCP code %d" % data[1]
             self.onlogon({'error': errstr + " reported in RAKP4"})
             return -9
-        localsid = struct.unpack("<I", bytes(data[4:8]))[0]
+        localsid = _U32.unpack_from(data, 4)[0]
         if localsid != self.localsid:  # ignore if wrong session id indicated
             return -9
         hmacdata = self.randombytes +\
-            struct.pack("<I", self.pendingsessionid) +\
+            _U32.pack(self.pendingsessionid) +\
             self.remoteguid
-        expectedauthcode = hmac.new(
-            self.sik, hmacdata, self.currhashlib).digest()[:self.currhashlen]
+        expectedauthcode = self.sikhmac.copy()
+        expectedauthcode.update(hmacdata)
+        expectedauthcode = expectedauthcode.digest()[:self.currhashlen]
         aclen = len(expectedauthcode)
-        authcode = struct.pack("%dB" % aclen, *data[8:aclen + 8])
-        if authcode != expectedauthcode:
+        authcode = bytes(data[8:aclen + 8])
+        if not hmac.compare_digest(authcode, expectedauthcode):
             self.onlogon({'error': "Invalid RAKP4 integrity code (wrong Kg?)"})
             return
         self.sessionid = self.pendingsessionid
@@ -1737,19 +1895,18 @@ class Session(object):
         # doing anything, though it shouldn't matter
         self.lastpayload = None
         self.last_payload_type = None
-        response = {'netfn': payload[1] >> 2}
-        # ^^ remove header of rsaddr/netfn/lun/checksum/rq/seq/lun
-        del payload[0:5]
-        # remove the trailing checksum
-        del payload[-1]
-        response['command'] = payload[0]
+        response = {'netfn': payload[1] >> 2, 'command': payload[5]}
         if self.servermode:
-            del payload[0:1]
-            response['data'] = payload
+            datastart = 6
         else:
-            response['code'] = payload[1]
-            del payload[0:2]
-            response['data'] = payload
+            response['code'] = payload[6]
+            datastart = 7
+        # remove the trailing checksum, then the header of
+        # rsaddr/netfn/lun/checksum/rq/seq/lun/command and any completion
+        # code, both trims being cheap at the ends of a bytearray
+        del payload[-1]
+        del payload[:datastart]
+        response['data'] = payload
         self.timeout = initialtimeout + (0.5 * random.random())
         if not self.servermode and len(self.pendingpayloads) > 0:
             (nextpayload, nextpayloadtype, retry) = \
@@ -1872,8 +2029,7 @@ class Session(object):
                     retry=sessionok)
             self.raw_command(
                 command=0x3c, netfn=6,
-                data=struct.unpack(
-                    "4B", struct.pack("I", self.sessionid)),
+                data=_U32.pack(self.sessionid),
                 retry=False)
         # stop trying for a keepalive,
         self.lastpayload = None
@@ -41,22 +41,13 @@ KEEPALIVE_SESSIONS = threading.RLock()
 WAITING_SESSIONS = threading.RLock()
 
 
-try:
-    dict.iteritems
-
-    def dictitems(d):
-        return d.iteritems()
-except AttributeError:
-    def dictitems(d):
-        return d.items()
-
 # minimum timeout for first packet to retry in any given
 # session.  This will be randomized to stagger out retries
 # in case of congestion
 initialtimeout = 0.5
 
 
-ioqueue = collections.deque([])
+ioqueue = collections.deque()
 ipv6support = None
 selectdeadline = 0
 running = True
@@ -68,7 +59,7 @@ MAX_BMCS_PER_SOCKET = 64
 # maximum time to allow idle, more than this and BMC may assume
 MAX_IDLE = 29
 # incorrect idle
-sessionqueue = collections.deque([])
+sessionqueue = collections.deque()
 
 
 try:
@@ -217,11 +208,11 @@ class Session(object):
         self.lastpayload = None
         self._customkeepalives = None
         # queue of events denoting line to run a cmd
-        self.evq = collections.deque([])
+        self.evq = collections.deque()
         self.bmc = bmc
         # a private queue for packets for which this session handler
         # is destined to receive
-        self.pktqueue = collections.deque([])
+        self.pktqueue = collections.deque()
 
         try:
             self.userid = userid.encode('utf-8')
@@ -230,7 +221,7 @@ class Session(object):
             self.userid = userid
             self.password = password
         self.nowait = False
-        self.pendingpayloads = collections.deque([])
+        self.pendingpayloads = collections.deque()
         self.request_entry = []
         self.kgo = kg
         if kg is not None:
@@ -883,8 +874,9 @@ class Session(object):
                         cmd()
                         continue
                     keptalive = True
-                    cmd['callback'] = self._keepalive_wrapper(callback)
-                    self.raw_command(**cmd)
+                    # cmd is left untouched, so registrants may share it
+                    self.raw_command(
+                        callback=self._keepalive_wrapper(callback), **cmd)
             if not keptalive:
                 if self.incommand:
                     # if currently in command, no cause to keepalive
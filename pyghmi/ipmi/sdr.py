@@ -29,15 +29,13 @@ remote client to care about.  For example, smbus information is being
 skipped for now
 """
 
+import collections
 import math
 import os
-import random
-import string
 import struct
+import sys
 import weakref
 
-import six
-
 import pyghmi.constants as const
 import pyghmi.exceptions as exc
 
@@ -46,7 +44,14 @@ TYPE_UNKNOWN = 0
 TYPE_SENSOR = 1
 TYPE_FRU = 2
 
-shared_sdrs = {}
+shared_sdrs = collections.OrderedDict()
+max_shared_sdrs = 64
+
+# big endian fields: cache file record count, FRU device type and
+# modifier, and the SDR repository timestamp
+_U32BE = struct.Struct('!I')
+_U16BE = struct.Struct('!H')
+_U64BE = struct.Struct('!Q')
 
 
 oem_type_offsets = {
@@ -76,25 +81,63 @@ oem_type_offsets = {
 def ones_complement(value, bits):
     # utility function to help with the large amount of 2s
     # complement prevalent in ipmi spec
-    signbit = 0b1 << (bits - 1)
-    if value & signbit:
-        # if negative, subtract 1, then take 1s
-        # complement given bits width
-        return 0 - (value ^ ((0b1 << bits) - 1))
-    else:
-        return value
+    # if negative, the 1s complement of value is its distance below the
+    # all ones pattern of the given bits width
+    return value - ((value >> (bits - 1)) & 1) * ((0b1 << bits) - 1)
 
 
 def twos_complement(value, bits):
     # utility function to help with the large amount of 2s
     # complement prevalent in ipmi spec
-    signbit = 0b1 << (bits - 1)
-    if value & signbit:
-        # if negative, subtract 1, then take 1s
-        # complement given bits width
-        return 0 - ((value - 1) ^ ((0b1 << bits) - 1))
-    else:
-        return value
+    # if negative, the sign bit stands for -2**(bits-1) rather than
+    # 2**(bits-1), so take 2**bits back off
+    return value - (((value >> (bits - 1)) & 1) << bits)
+
+
+def _atomic_write(filename, data):
+    # Write to a scratch file next to the target and only move it into place
+    # once it is safely on disk, so a reader, or a crash, never sees a
+    # partial file.
+    tmpname = filename + '.' + os.urandom(6).hex()
+    try:
+        with open(tmpname, 'wb') as tmpfile:
+            tmpfile.write(data)
+            tmpfile.flush()
+            os.fsync(tmpfile.fileno())
+        os.replace(tmpname, filename)
+    except Exception:
+        try:
+            os.unlink(tmpname)
+        except OSError:
+            pass
+        raise
+
+
+def _pack_sdr_cache(sdrraw):
+    # The cache holds a record count, a table of record lengths, then the
+    # records back to back.
+    cdata = struct.pack('!I%dH' % len(sdrraw), len(sdrraw),
+                        *[len(csdr) for csdr in sdrraw])
+    return cdata + b''.join(sdrraw)
+
+
+def _unpack_sdr_cache(cdata):
+    # Return the records written by _pack_sdr_cache, or None if the file
+    # does not add up, as when it was truncated.
+    try:
+        numrecords = _U32BE.unpack_from(cdata)[0]
+        csdrlens = struct.unpack_from('!%dH' % numrecords, cdata,
+                                      _U32BE.size)
+    except struct.error:
+        return None
+    coffset = _U32BE.size + 2 * numrecords
+    if coffset + sum(csdrlens) != len(cdata):
+        return None
+    csdrs = []
+    for csdrlen in csdrlens:
+        csdrs.append(cdata[coffset:coffset + csdrlen])
+        coffset += csdrlen
+    return csdrs
 
 
 unit_types = {
@@ -203,6 +246,56 @@ sensor_rates = {
     6: ' per day',
 }
 
+# SDREntry decode methods by record type
+_record_decoders = {
+    1: 'full_decode',  # full sdr
+    2: 'compact_decode',  # compact sdr
+    3: 'eventonly_decode',  # event only
+    8: 'association_decode',  # entity association
+    0x11: 'fru_decode',  # FRU locator
+    0x12: 'mclocate_decode',  # Management controller
+    0xc0: 'oem_decode',  # OEM format
+}
+
+# threshold comparison status bits of the get sensor reading response,
+# as (mask, description, health, trap offset)
+_threshold_states = (
+    (0b1, 'lower non-critical threshold', const.Health.Warning, 1),
+    (0b10, 'lower critical threshold', const.Health.Critical, 2),
+    (0b100, 'lower non-recoverable threshold', const.Health.Failed, 3),
+    (0b1000, 'upper non-critical threshold', const.Health.Warning, 4),
+    (0b10000, 'upper critical threshold', const.Health.Critical, 5),
+    (0b100000, 'upper non-recoverable threshold', const.Health.Failed, 6),
+)
+# for 1/x formulas, where the sense of upper and lower is backwards
+_inverted_threshold_states = (
+    (0b1, 'upper non-critical threshold', const.Health.Warning, 1),
+    (0b10, 'upper critical threshold', const.Health.Critical, 2),
+    (0b100, 'upper non-recoverable threshold', const.Health.Failed, 3),
+    (0b1000, 'lower non-critical threshold', const.Health.Warning, 4),
+    (0b10000, 'lower critical threshold', const.Health.Critical, 5),
+    (0b100000, 'lower non-recoverable threshold', const.Health.Failed, 6),
+)
+
+# linearization functions from table 43-1, indexed by the 'L' enumeration
+_linearizations = (
+    lambda x: x,
+    math.log,
+    math.log10,
+    math.log2,
+    math.exp,
+    lambda x: 10 ** x,
+    lambda x: 2 ** x,
+    lambda x: 1 / x,
+    lambda x: x ** 2,
+    lambda x: x ** 3,
+    math.sqrt,
+    lambda x: x ** (1.0 / 3),
+)
+
+# BCD plus digits above 9, as they come out of bytes.hex()
+_bcdplus_map = str.maketrans('abcdef', ' -.:,_')
+
 
 class SensorReading(object):
     """Representation of the state of a sensor.
@@ -217,41 +310,32 @@ class SensorReading(object):
     imprecision: The amount by which the actual measured value may deviate from
         'value' due to limitations in the resolution of the given sensor.
     """
+    __slots__ = ['broken_sensor_ids', 'health', 'type', 'value', 'imprecision',
+                 'states', 'state_ids', 'unavailable', 'units', 'name']
 
     def __init__(self, reading, suffix):
         self.broken_sensor_ids = {}
-        self.health = const.Health.Ok
+        self.health = reading.get('health', const.Health.Ok)
         self.type = reading['type']
-        self.value = None
-        self.imprecision = None
-        self.states = []
-        self.state_ids = []
+        self.value = reading.get('value')
+        self.imprecision = reading.get('imprecision')
+        self.states = reading.get('states', [])
+        self.state_ids = reading.get('state_ids', [])
         self.unavailable = 0
-        try:
-            self.health = reading['health']
-            self.states = reading['states']
-            self.state_ids = reading['state_ids']
-            self.value = reading['value']
-            self.imprecision = reading['imprecision']
-        except KeyError:
-            pass
         if 'unavailable' in reading:
             self.unavailable = 1
         self.units = suffix
         self.name = reading['name']
 
     def __repr__(self):
-        return repr({
-            'value': self.value,
-            'states': self.states,
-            'state_ids': self.state_ids,
-            'units': self.units,
-            'imprecision': self.imprecision,
-            'name': self.name,
-            'type': self.type,
-            'unavailable': self.unavailable,
-            'health': self.health
-        })
+        # same text as the repr of a dict of these fields, minus the dict
+        return (
+            "{'value': %r, 'states': %r, 'state_ids': %r, 'units': %r, "
+            "'imprecision': %r, 'name': %r, 'type': %r, 'unavailable': %r, "
+            "'health': %r}" % (
+                self.value, self.states, self.state_ids, self.units,
+                self.imprecision, self.name, self.type, self.unavailable,
+                self.health))
 
     def simplestring(self):
         """Return a summary string of the reading.
@@ -282,12 +366,23 @@ class SDREntry(object):
     This is created and consumed by pyghmi internally, there is no reason for
     external code to pay attention to this class.
     """
+    __slots__ = ['mfg_id', 'prod_id', 'event_consts', '_state_cache',
+                 'readable', 'reportunsupported', 'rectype', 'linearization',
+                 'sdrtype', 'sensor_name', 'fru_name', 'fru_number',
+                 'fru_logical', 'fru_type_and_modifier', 'has_thresholds',
+                 'sensor_owner', 'sensor_lun', 'sensor_number', 'entity',
+                 'sensor_type_number', 'reading_type', 'sensor_type',
+                 'numeric_format', 'sensor_rate', 'unit_mod', 'percent',
+                 'baseunit', 'modunit', 'unit_suffix', 'm', 'b', 'tolerance',
+                 'accuracy', 'accuracyexp', 'direction', 'resultexponent',
+                 'resultfactor', 'readingmargin']
 
     def __init__(self, entrybytes, event_consts, reportunsupported=False,
                  mfg_id=0, prod_id=0):
         self.mfg_id = mfg_id
         self.prod_id = prod_id
         self.event_consts = event_consts
+        self._state_cache = None  # created on first discrete reading
         # ignore record id for now, we only care about the sensor number for
         # moment
         self.readable = True
@@ -299,21 +394,9 @@ class SDREntry(object):
         self.linearization = None
         # most important to get going are 1, 2, and 11
         self.sdrtype = TYPE_SENSOR  # assume a sensor
-        if self.rectype == 1:  # full sdr
-            self.full_decode(entrybytes[5:])
-        elif self.rectype == 2:  # full sdr
-            self.compact_decode(entrybytes[5:])
-        elif self.rectype == 3:  # event only
-            self.eventonly_decode(entrybytes[5:])
-        elif self.rectype == 8:  # entity association
-            self.association_decode(entrybytes[5:])
-        elif self.rectype == 0x11:  # FRU locator
-            self.fru_decode(entrybytes[5:])
-        elif self.rectype == 0x12:  # Management controller
-            self.mclocate_decode(entrybytes[5:])
-        elif self.rectype == 0xc0:  # OEM format
-            self.sdrtype = TYPE_UNKNOWN   # assume undefined
-            self.oem_decode(entrybytes[5:])
+        decoder = _record_decoders.get(self.rectype)
+        if decoder is not None:
+            getattr(self, decoder)(entrybytes[5:])
         elif self.reportunsupported:
             raise NotImplementedError
         else:
@@ -329,7 +412,8 @@ class SDREntry(object):
             return "UNKNOWN"
 
     def oem_decode(self, entry):
-        mfgid = entry[0] + (entry[1] << 8) + (entry[2] << 16)
+        self.sdrtype = TYPE_UNKNOWN   # assume undefined
+        mfgid = int.from_bytes(entry[:3], 'little')
         if self.reportunsupported:
             raise NotImplementedError("No support for mfgid %X" % mfgid)
 
@@ -346,7 +430,7 @@ class SDREntry(object):
         self.fru_number = entry[1]
         self.fru_logical = (entry[2] & 0b10000000) == 0b10000000
         # 0x8  to 0x10..  0 unspecified except on 0x10, 1 is dimm
-        self.fru_type_and_modifier = (entry[5] << 8) + entry[6]
+        self.fru_type_and_modifier = _U16BE.unpack_from(entry, 5)[0]
 
     def association_decode(self, entry):
         # table 43-4 Entity Associaition Record
@@ -372,26 +456,33 @@ class SDREntry(object):
         # event only, compact and full are very similar
         # this function handles the common aspects of compact and full
         # offsets from spec, minus 6
+        event_consts = self.event_consts
+        rectype = self.rectype
         self.has_thresholds = False
         self.sensor_owner = entry[0]
         self.sensor_lun = entry[1] & 0x03
         self.sensor_number = entry[2]
-        self.entity = self.event_consts.entity_ids.get(
-            entry[3], 'Unknown entity {0}'.format(entry[3]))
-        if self.rectype == 3:
+        # the descriptive strings below repeat across most sensors, intern
+        # them so that a large SDR holds one copy of each
+        entity = event_consts.entity_ids.get(entry[3])
+        if entity is None:
+            entity = sys.intern('Unknown entity {0}'.format(entry[3]))
+        self.entity = entity
+        if rectype == 3:
             self.sensor_type_number = entry[5]
             self.reading_type = entry[6]  # table 42-1
         else:
             self.sensor_type_number = entry[7]
             self.reading_type = entry[8]  # table 42-1
-        if self.rectype == 1 and entry[6] & 0b00001100:
+        if rectype == 1 and entry[6] & 0b00001100:
             self.has_thresholds = True
         try:
-            self.sensor_type = self.event_consts.sensor_type_codes[
+            self.sensor_type = event_consts.sensor_type_codes[
                 self.sensor_type_number]
         except KeyError:
-            self.sensor_type = "UNKNOWN type " + str(self.sensor_type_number)
-        if self.rectype == 3:
+            self.sensor_type = sys.intern(
+                "UNKNOWN type " + str(self.sensor_type_number))
+        if rectype == 3:
             return
         # 0: unspecified
         # 1: generic threshold based
@@ -406,7 +497,7 @@ class SDREntry(object):
         # the violation under the assumption that things are not so hard up
         # that there will ever be a need for compact sensors supporting numeric
         # values
-        if self.rectype == 2:
+        if rectype == 2:
             self.numeric_format = 3
         else:
             self.numeric_format = (entry[15] & 0b11000000) >> 6
@@ -430,8 +521,8 @@ class SDREntry(object):
                     self.sensor_type = 'Energy'
         self.baseunit = unit_types[entry[16]]
         self.modunit = unit_types[entry[17]]
-        self.unit_suffix = self.percent + self.baseunit + self.unit_mod + \
-            self.modunit
+        self.unit_suffix = sys.intern(
+            self.percent + self.baseunit + self.unit_mod + self.modunit)
 
     def full_decode(self, entry):
         # offsets are table from spec, minus 6
@@ -453,18 +544,28 @@ class SDREntry(object):
             self.decode_formula(entry[19:25])
 
     def _decode_state(self, state):
+        # the answer only depends on the record and the state, so sensors
+        # polled over and over skip the table walk after the first time
+        statecache = self._state_cache
+        if statecache is None:
+            statecache = self._state_cache = {}
+        elif state in statecache:
+            return statecache[state]
+        reading_type = self.reading_type
         mapping = self.event_consts.generic_type_offsets
         try:
-            if self.reading_type in mapping:
-                desc = mapping[self.reading_type][state]['desc']
-                health = mapping[self.reading_type][state]['severity']
-            elif self.reading_type == 0x6f:
+            if reading_type in mapping:
+                sensedata = mapping[reading_type][state]
+                desc = sensedata['desc']
+                health = sensedata['severity']
+            elif reading_type == 0x6f:
                 mapping = self.event_consts.sensor_type_offsets
-                desc = mapping[self.sensor_type_number][state]['desc']
-                health = mapping[self.sensor_type_number][state]['severity']
-            elif self.reading_type >= 0x70 and self.reading_type <= 0x7f:
+                sensedata = mapping[self.sensor_type_number][state]
+                desc = sensedata['desc']
+                health = sensedata['severity']
+            elif reading_type >= 0x70 and reading_type <= 0x7f:
                 sensedata = oem_type_offsets[self.mfg_id][self.prod_id][
-                    self.reading_type][self.sensor_type_number][state]
+                    reading_type][self.sensor_type_number][state]
                 desc = sensedata['desc']
                 health = sensedata['severity']
             else:
@@ -474,6 +575,7 @@ class SDREntry(object):
             desc = "Unknown state %d for reading type %d/sensor type %d" % (
                 state, self.reading_type, self.sensor_type_number)
             health = const.Health.Ok
+        statecache[state] = desc, health
         return desc, health
 
     def decode_sensor_reading(self, ipmicmd, reading):
@@ -483,7 +585,8 @@ class SDREntry(object):
             'type': self.sensor_type,
             'id': self.sensor_number,
         }
-        if reading[1] & 0b100000 or not reading[1] & 0b1000000:
+        # usable only with bit 5 clear and bit 6 set
+        if (reading[1] & 0b1100000) != 0b1000000:
             output['unavailable'] = 1
             return SensorReading(output, self.unit_suffix)
         if self.numeric_format == 2:
@@ -494,63 +597,39 @@ class SDREntry(object):
             numeric = reading[0]
         discrete = True
         if numeric is not None:
-            lowerbound = numeric - (0.5 + (self.tolerance / 2.0))
-            upperbound = numeric + (0.5 + (self.tolerance / 2.0))
+            lowerbound = numeric - self.readingmargin
+            upperbound = numeric + self.readingmargin
             lowerbound = self.decode_value(ipmicmd, lowerbound)
             upperbound = self.decode_value(ipmicmd, upperbound)
             output['value'] = (lowerbound + upperbound) / 2.0
             output['imprecision'] = output['value'] - lowerbound
             discrete = False
-        upper = 'upper'
-        lower = 'lower'
-        if self.linearization == 7:
-            # if the formula is 1/x, then the intuitive sense of upper and
-            # lower are backwards
-            upper = 'lower'
-            lower = 'upper'
         output['states'] = []
         output['state_ids'] = []
         output['health'] = const.Health.Ok
         if discrete:
-            for state in range(8):
-                if reading[2] & (0b1 << state):
-                    statedesc, health = self._decode_state(state)
-                    output['health'] |= health
-                    output['states'].append(statedesc)
-                    output['state_ids'].append(self.assert_trap_value(state))
+            # offsets 0-7 are in the third byte, 8-14 in the optional fourth
+            bits = reading[2]
             if len(reading) > 3:
-                for state in range(7):
-                    if reading[3] & (0b1 << state):
-                        statedesc, health = self._decode_state(state + 8)
-                        output['health'] |= health
-                        output['states'].append(statedesc)
-                        output['state_ids'].append(
-                            self.assert_trap_value(state + 8))
+                bits |= (reading[3] & 0b1111111) << 8
+            while bits:  # visit only the asserted states, lowest first
+                state = (bits & -bits).bit_length() - 1
+                bits &= bits - 1
+                statedesc, health = self._decode_state(state)
+                output['health'] |= health
+                output['states'].append(statedesc)
+                output['state_ids'].append(self.assert_trap_value(state))
         else:
-            if reading[2] & 0b1:
-                output['health'] |= const.Health.Warning
-                output['states'].append(lower + " non-critical threshold")
-                output['state_ids'].append(self.assert_trap_value(1))
-            if reading[2] & 0b10:
-                output['health'] |= const.Health.Critical
-                output['states'].append(lower + " critical threshold")
-                output['state_ids'].append(self.assert_trap_value(2))
-            if reading[2] & 0b100:
-                output['health'] |= const.Health.Failed
-                output['states'].append(lower + " non-recoverable threshold")
-                output['state_ids'].append(self.assert_trap_value(3))
-            if reading[2] & 0b1000:
-                output['health'] |= const.Health.Warning
-                output['states'].append(upper + " non-critical threshold")
-                output['state_ids'].append(self.assert_trap_value(4))
-            if reading[2] & 0b10000:
-                output['health'] |= const.Health.Critical
-                output['states'].append(upper + " critical threshold")
-                output['state_ids'].append(self.assert_trap_value(5))
-            if reading[2] & 0b100000:
-                output['health'] |= const.Health.Failed
-                output['states'].append(upper + " non-recoverable threshold")
-                output['state_ids'].append(self.assert_trap_value(6))
+            thresholds = _threshold_states
+            if self.linearization == 7:
+                # if the formula is 1/x, then the intuitive sense of upper and
+                # lower are backwards
+                thresholds = _inverted_threshold_states
+            for mask, desc, health, offset in thresholds:
+                if reading[2] & mask:
+                    output['health'] |= health
+                    output['states'].append(desc)
+                    output['state_ids'].append(self.assert_trap_value(offset))
         return SensorReading(output, self.unit_suffix)
 
     def _set_tmp_formula(self, ipmicmd, value):
@@ -572,33 +651,10 @@ class SDREntry(object):
             self._set_tmp_formula(ipmicmd, value)
             linearization = 0
         # time to compute the pre-linearization value.
-        decoded = float((value * self.m + self.b)
-                        * (10 ** self.resultexponent))
-        if linearization == 0:
-            return decoded
-        elif linearization == 1:
-            return math.log(decoded)
-        elif linearization == 2:
-            return math.log(decoded, 10)
-        elif linearization == 3:
-            return math.log(decoded, 2)
-        elif linearization == 4:
-            return math.exp(decoded)
-        elif linearization == 5:
-            return 10 ** decoded
-        elif linearization == 6:
-            return 2 ** decoded
-        elif linearization == 7:
-            return 1 / decoded
-        elif linearization == 8:
-            return decoded ** 2
-        elif linearization == 9:
-            return decoded ** 3
-        elif linearization == 10:
-            return math.sqrt(decoded)
-        elif linearization == 11:
-            return decoded ** (1.0 / 3)
-        else:
+        decoded = float((value * self.m + self.b) * self.resultfactor)
+        try:
+            return _linearizations[linearization](decoded)
+        except IndexError:
             raise NotImplementedError
 
     def decode_formula(self, entry):
@@ -613,6 +669,9 @@ class SDREntry(object):
         bexponent = twos_complement(entry[5] & 0b1111, 4)
         # might as well do the math to 'b' now rather than wait for later
         self.b = self.b * (10**bexponent)
+        # likewise for the factors applied to every reading
+        self.resultfactor = 10 ** self.resultexponent
+        self.readingmargin = 0.5 + (self.tolerance / 2.0)
 
     def tlv_decode(self, tlv, data):
         # Per IPMI 'type/length byte format
@@ -621,30 +680,24 @@ class SDREntry(object):
             return ""
         if ipmitype == 0:  # Unicode per 43.15 in ipmi 2.0 spec
             # the spec is not specific about encoding, assuming utf8
-            return six.text_type(struct.pack("%dB" % len(data), *data),
-                                 "utf_8")
+            return bytes(data).decode('utf-8', 'replace')
         elif ipmitype == 1:  # BCD '+'
-            tmpl = "%02X" * len(data)
-            tstr = tmpl % tuple(data)
-            tstr = tstr.replace("A", " ").replace("B", "-").replace("C", ".")
-            return tstr.replace("D", ":").replace("E", ",").replace("F", "_")
+            return bytes(data).hex().translate(_bcdplus_map)
         elif ipmitype == 2:  # 6 bit ascii, start at 0x20
             # the ordering is very peculiar and is best understood from
             # IPMI SPEC "6-bit packed ascii example
-            tstr = ""
-            while len(data) >= 3:  # the packing only works with 3 byte chunks
-                tstr += chr((data[0] & 0b111111) + 0x20)
-                tstr += chr(((data[1] & 0b1111) << 2) + (data[0] >> 6) + 0x20)
-                tstr += chr(((data[2] & 0b11) << 4) + (data[1] >> 4) + 0x20)
-                tstr += chr((data[2] >> 2) + 0x20)
-            if not isinstance(tstr, str):
-                tstr = tstr.decode('utf-8')
-            return tstr
+            # every 3 bytes read little endian hold four 6 bit characters
+            tstr = bytearray()
+            for i in range(0, len(data) // 3 * 3, 3):
+                # the packing only works with 3 byte chunks
+                chunk = int.from_bytes(data[i:i + 3], 'little')
+                tstr += bytes(((chunk & 0b111111) + 0x20,
+                               ((chunk >> 6) & 0b111111) + 0x20,
+                               ((chunk >> 12) & 0b111111) + 0x20,
+                               (chunk >> 18) + 0x20))
+            return tstr.decode('ascii')
         elif ipmitype == 3:  # ACSII+LATIN1
-            ret = struct.pack("%dB" % len(data), *data)
-            if not isinstance(ret, str):
-                ret = ret.decode('utf-8')
-            return ret
+            return bytes(data).decode('utf-8', 'replace')
 
 
 class SDR(object):
@@ -661,6 +714,7 @@ class SDR(object):
         self.sensors = {}
         self.fru = {}
         self.cachedir = cachedir
+        self.event_consts = None
         self.read_info()
 
     def read_info(self):
@@ -674,9 +728,8 @@ class SDR(object):
         self.fw_major = rsp['data'][2] & 0b1111111
         self.fw_minor = "%02X" % rsp['data'][3]  # BCD encoding, oddly enough
         self.ipmiversion = rsp['data'][4]  # 51h = 1.5, 02h = 2.0
-        self.mfg_id = (rsp['data'][8] << 16) + (rsp['data'][7] << 8) + \
-            rsp['data'][6]
-        self.prod_id = (rsp['data'][10] << 8) + rsp['data'][9]
+        self.mfg_id = int.from_bytes(rsp['data'][6:9], 'little')
+        self.prod_id = int.from_bytes(rsp['data'][9:11], 'little')
         if len(rsp['data']) > 11:
             self.aux_fw = self.decode_aux(rsp['data'][11:15])
         if rsp['data'][1] & 0b10000000 and rsp['data'][5] & 0b10 == 0:
@@ -698,7 +751,7 @@ class SDR(object):
         rsp = self.ipmicmd.raw_command(netfn=0x0a, command=0x22)
         if rsp['code'] != 0:
             raise exc.IpmiException(rsp['error'])
-        return rsp['data'][0] + (rsp['data'][1] << 8)
+        return int.from_bytes(rsp['data'][:2], 'little')
 
     def get_sdr(self):
         repinfo = self.ipmicmd.xraw_command(netfn=0x0a, command=0x20)
@@ -717,52 +770,46 @@ class SDR(object):
         # NOTE(jbjohnso): not looking to support the various options in op
         # support, ignore those for now, reservation if some BMCs can't read
         # full SDR in one slurp
-        modtime = struct.unpack('!Q', bytes(repinfo['data'][5:13]))[0]
-        recid = 0
-        rsvid = 0  # partial 'get sdr' will require this
-        offset = 0
-        size = 0xff
-        chunksize = 128
+        modtime = _U64BE.unpack_from(repinfo['data'], 5)[0]
+        sdrkey = (self.fw_major, self.fw_minor, self.mfg_id, self.prod_id,
+                  self.device_id, modtime)
         try:
-            csdrs = shared_sdrs[
-                (self.fw_major, self.fw_minor, self.mfg_id, self.prod_id,
-                 self.device_id, modtime)]
+            csdrs = shared_sdrs[sdrkey]
+        except KeyError:
+            pass
+        else:
             self.sensors = csdrs['sensors']
             self.fru = csdrs['fru']
+            self._share_sdrs(sdrkey)  # mark it as recently used
             return
-        except KeyError:
-            pass
         cachefilename = None
-        self.broken_sensor_ids = {}
+        self.broken_sensor_ids = set()
         if self.cachedir:
-            cachefilename = 'sdrcache-2.{0}.{1}.{2}.{3}.{4}.{5}'.format(
+            cachefilename = 'sdrcache-3.{0}.{1}.{2}.{3}.{4}.{5}'.format(
                 self.mfg_id, self.prod_id, self.device_id, self.fw_major,
                 self.fw_minor, modtime)
             cachefilename = os.path.join(self.cachedir, cachefilename)
         if cachefilename and os.path.isfile(cachefilename):
             with open(cachefilename, 'rb') as cfile:
-                csdrlen = cfile.read(2)
-                while csdrlen:
-                    csdrlen = struct.unpack('!H', csdrlen)[0]
-                    self.add_sdr(cfile.read(csdrlen))
-                    csdrlen = cfile.read(2)
-                for sid in self.broken_sensor_ids:
-                    try:
-                        del self.sensors[sid]
-                    except KeyError:
-                        pass
-                shared_sdrs[
-                    (self.fw_major, self.fw_minor, self.mfg_id, self.prod_id,
-                     self.device_id, modtime)] = {
-                    'sensors': self.sensors,
-                    'fru': self.fru,
-                }
+                csdrs = _unpack_sdr_cache(cfile.read())
+            # a damaged cache is fetched afresh below, which replaces it
+            if csdrs is not None:
+                for csdr in csdrs:
+                    self.add_sdr(csdr)
+                for sid in self.broken_sensor_ids & self.sensors.keys():
+                    del self.sensors[sid]
+                self._share_sdrs(sdrkey)
                 return
+        # neither cache had it, so fetch the whole repository from the BMC
+        recid = 0
+        rsvid = 0  # partial 'get sdr' will require this
+        offset = 0
+        size = 0xff
+        chunksize = 128
         sdrraw = [] if cachefilename else None
         while recid != 0xffff:  # per 33.12 Get SDR command, 0xffff marks end
             newrecid = 0
             currlen = 0
-            sdrdata = bytearray()
             while True:  # loop until SDR fetched wholly
                 if size != 0xff and rsvid == 0:
                     rsvid = self.get_sdr_reservation()
@@ -788,10 +835,16 @@ class SDR(object):
                 if sdrrec['code'] != 0:
                     raise exc.IpmiException(sdrrec['error'])
                 if newrecid == 0:
-                    newrecid = (sdrrec['data'][1] << 8) + sdrrec['data'][0]
+                    newrecid = int.from_bytes(sdrrec['data'][:2], 'little')
                 if currlen == 0:
                     currlen = sdrrec['data'][6] + 5  # compensate for header
-                sdrdata.extend(sdrrec['data'][2:])
+                    # size the record once, later chunks fill it in place
+                    sdrdata = bytearray(currlen)
+                    received = 0
+                with memoryview(sdrrec['data']) as rspview:
+                    chunk = rspview[2:]  # skip the next record id
+                    sdrdata[offset:offset + len(chunk)] = chunk
+                    received = max(received, offset + len(chunk))
                 # determine next offset to use based on current offset and the
                 # size used last time.
                 offset += size
@@ -800,8 +853,8 @@ class SDR(object):
                 if size == 5 and offset == 5:
                     # bump up size after header retrieval
                     size = chunksize
-                if (offset + size) > currlen:
-                    size = currlen - offset
+                size = min(size, currlen - offset)
+            del sdrdata[received:]  # in case the BMC sent less than it said
             self.add_sdr(sdrdata)
             if sdrraw is not None:
                 sdrraw.append(bytes(sdrdata))
@@ -811,53 +864,62 @@ class SDR(object):
             if newrecid == recid:
                 raise exc.BmcErrorException("Incorrect SDR record id from BMC")
             recid = newrecid
-        for sid in self.broken_sensor_ids:
-            try:
-                del self.sensors[sid]
-            except KeyError:
-                pass
-        shared_sdrs[(self.fw_major, self.fw_minor, self.mfg_id, self.prod_id,
-                     self.device_id, modtime)] = {
+        for sid in self.broken_sensor_ids & self.sensors.keys():
+            del self.sensors[sid]
+        self._share_sdrs(sdrkey)
+        if cachefilename:
+            _atomic_write(cachefilename, _pack_sdr_cache(sdrraw))
+
+    def _share_sdrs(self, sdrkey):
+        # Offer the decoded SDR to other sessions with the same BMC firmware,
+        # forgetting the least recently used set once too many are held
+        shared_sdrs[sdrkey] = {
             'sensors': self.sensors,
             'fru': self.fru,
         }
-        if cachefilename:
-            suffix = ''.join(
-                random.choice(string.ascii_lowercase) for _ in range(12))
-            with open(cachefilename + '.' + suffix, 'wb') as cfile:
-                for csdr in sdrraw:
-                    cfile.write(struct.pack('!H', len(csdr)))
-                    cfile.write(csdr)
-            os.rename(cachefilename + '.' + suffix, cachefilename)
+        try:
+            shared_sdrs.move_to_end(sdrkey)
+        except KeyError:  # another thread already evicted it
+            pass
+        while len(shared_sdrs) > max_shared_sdrs:
+            try:
+                shared_sdrs.popitem(last=False)
+            except KeyError:  # another thread emptied it first
+                break
 
     def get_sensor_numbers(self):
-        for number in self.sensors:
-            if self.sensors[number].readable:
+        for number, sensor in self.sensors.items():
+            if sensor.readable:
                 yield number
 
     def make_sdr_entry(self, sdrbytes):
-        return SDREntry(sdrbytes, self.ipmicmd.get_event_constants(),
+        # the constants do not change over a session, fetch them once
+        if self.event_consts is None:
+            self.event_consts = self.ipmicmd.get_event_constants()
+        return SDREntry(sdrbytes, self.event_consts,
                         False, self.mfg_id, self.prod_id)
 
     def add_sdr(self, sdrbytes):
-        if not isinstance(sdrbytes[0], int):
-            sdrbytes = bytearray(sdrbytes)
+        # sdrbytes is bytes or a bytearray, either of which indexes to ints
         newent = self.make_sdr_entry(sdrbytes)
-        if newent.sdrtype == TYPE_SENSOR:
-            id = '{0}.{1}.{2}'.format(
+        sdrtype = newent.sdrtype
+        if sdrtype == TYPE_SENSOR:
+            sensors = self.sensors
+            id = '%d.%d.%d' % (
                 newent.sensor_owner, newent.sensor_number, newent.sensor_lun)
-            if id in self.sensors:
-                self.broken_sensor_ids[id] = True
+            if id in sensors:
+                self.broken_sensor_ids.add(id)
                 return
-            self.sensors[id] = newent
-        elif newent.sdrtype == TYPE_FRU:
+            sensors[id] = newent
+        elif sdrtype == TYPE_FRU:
+            fru = self.fru
             id = newent.fru_number
-            if id in self.fru:
-                self.broken_sensor_ids[id] = True
+            if id in fru:
+                self.broken_sensor_ids.add(id)
                 return
-            self.fru[id] = newent
+            fru[id] = newent
 
     def decode_aux(self, auxdata):
         # This is where manufacturers can add their own
         # decode information
-        return "".join(hex(x) for x in auxdata)
+        return ''.join(map(hex, auxdata))
@@ -13,6 +13,11 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import os
+import shutil
+import struct
+import tempfile
+
 from pyghmi.ipmi import sdr
 from pyghmi.tests.unit import base
 
@@ -21,3 +26,65 @@ class SDRTestCase(base.TestCase):
 
     def test_ones_complement(self):
         self.assertEqual(sdr.ones_complement(127, 8), 127)
+        self.assertEqual(sdr.ones_complement(0, 8), 0)
+        # with the sign bit set, all ones is negative zero
+        self.assertEqual(sdr.ones_complement(0xff, 8), 0)
+        self.assertEqual(sdr.ones_complement(0xfe, 8), -1)
+        self.assertEqual(sdr.ones_complement(0x80, 8), -127)
+        self.assertEqual(sdr.ones_complement(0x200, 10), -511)
+        self.assertEqual(sdr.ones_complement(0x3fe, 10), -1)
+
+    def test_twos_complement(self):
+        for bits in (8, 10, 16):
+            self.assertEqual(sdr.twos_complement(0, bits), 0)
+            self.assertEqual(sdr.twos_complement(1, bits), 1)
+            maxpos = (1 << (bits - 1)) - 1
+            self.assertEqual(sdr.twos_complement(maxpos, bits), maxpos)
+            self.assertEqual(sdr.twos_complement(maxpos + 1, bits),
+                             -(maxpos + 1))
+            self.assertEqual(sdr.twos_complement((1 << bits) - 1, bits), -1)
+
+    def test_decode_aux(self):
+        sdrobj = sdr.SDR.__new__(sdr.SDR)
+        self.assertEqual(sdrobj.decode_aux(bytearray(b'\x01\x0a\x00\xff')),
+                         '0x10xa0x00xff')
+        self.assertEqual(sdrobj.decode_aux(bytearray()), '')
+
+    def test_tlv_decode_sixbit_ascii(self):
+        # "IPMI" from the 6-bit packed ascii example in the IPMI spec
+        entry = sdr.SDREntry.__new__(sdr.SDREntry)
+        self.assertEqual(
+            entry.tlv_decode(0b10000011, bytearray(b'\x29\xdc\xa6')), 'IPMI')
+
+    def _write_sdr_cache(self, records):
+        cachedir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cachedir)
+        cachefilename = os.path.join(cachedir, 'sdrcache-3.test')
+        sdr._atomic_write(cachefilename, sdr._pack_sdr_cache(records))
+        self.assertEqual(os.listdir(cachedir), ['sdrcache-3.test'])
+        with open(cachefilename, 'rb') as cfile:
+            return cfile.read()
+
+    def test_sdr_cache_round_trip(self):
+        records = [b'\x01\x00\x51\x01\x03abc', b'', b'\x02' * 64]
+        cdata = self._write_sdr_cache(records)
+        self.assertEqual(sdr._unpack_sdr_cache(cdata), records)
+        self.assertEqual(sdr._unpack_sdr_cache(self._write_sdr_cache([])),
+                         [])
+
+    def test_sdr_cache_truncated(self):
+        cdata = self._write_sdr_cache([b'\x01' * 10, b'\x02' * 20])
+        # cut inside the records, the length table and the record count
+        for length in (len(cdata) - 1, 10, 6, 3, 0):
+            self.assertIsNone(sdr._unpack_sdr_cache(cdata[:length]))
+
+    def test_sdr_cache_bad_length_table(self):
+        cdata = bytearray(self._write_sdr_cache([b'\x01' * 10, b'\x02' * 20]))
+        # a length table that claims more or less data than follows it
+        for reclen in (11, 9):
+            struct.pack_into('!H', cdata, 4, reclen)
+            self.assertIsNone(sdr._unpack_sdr_cache(bytes(cdata)))
+        # a record count that disagrees with the length table
+        struct.pack_into('!H', cdata, 4, 10)
+        struct.pack_into('!I', cdata, 0, 1)
+        self.assertIsNone(sdr._unpack_sdr_cache(bytes(cdata)))
@@ -0,0 +1,119 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.ciphers import algorithms
+from cryptography.hazmat.primitives.ciphers import Cipher
+from cryptography.hazmat.primitives.ciphers import modes
+
+from pyghmi.ipmi.private import session
+from pyghmi.tests.unit import base
+
+
+def _fresh_cipher(key, iv):
+    return Cipher(algorithm=algorithms.AES(key), mode=modes.CBC(iv),
+                  backend=default_backend())
+
+
+class AesCbcTestCase(base.TestCase):
+
+    def setUp(self):
+        super(AesCbcTestCase, self).setUp()
+        self.key = os.urandom(16)
+
+    def test_encrypt_matches_fresh_cipher(self):
+        aes = session._AesCbc(self.key)
+        # consecutive packets of varied length share the one CBC context
+        for blocks in (1, 2, 5, 1, 3, 1):
+            iv = aes.nextiv()
+            data = os.urandom(16 * blocks)
+            encryptor = _fresh_cipher(self.key, iv).encryptor()
+            expected = encryptor.update(data) + encryptor.finalize()
+            self.assertEqual(aes.encrypt(iv, data), expected)
+
+    def test_decrypt_matches_fresh_cipher(self):
+        aes = session._AesCbc(self.key)
+        for blocks in (1, 2, 5, 1, 3, 1):
+            iv = os.urandom(16)
+            data = os.urandom(16 * blocks)
+            decryptor = _fresh_cipher(self.key, iv).decryptor()
+            expected = decryptor.update(data) + decryptor.finalize()
+            decrypted = aes.decrypt(iv, bytearray(data))
+            self.assertIsInstance(decrypted, bytearray)
+            self.assertEqual(decrypted, expected)
+
+    def test_round_trip(self):
+        sender = session._AesCbc(self.key)
+        receiver = session._AesCbc(self.key)
+        for blocks in (3, 1, 4):
+            iv = sender.nextiv()
+            data = os.urandom(16 * blocks)
+            self.assertEqual(
+                receiver.decrypt(iv, sender.encrypt(iv, data)), data)
+
+    def test_decrypt_rejects_partial_blocks(self):
+        aes = session._AesCbc(self.key)
+        iv = os.urandom(16)
+        for length in (0, 1, 15, 17, 31):
+            self.assertIsNone(aes.decrypt(iv, bytearray(length)))
+        # a rejected packet must not disturb the chain for the next one
+        data = os.urandom(32)
+        encryptor = _fresh_cipher(self.key, iv).encryptor()
+        self.assertEqual(aes.decrypt(iv, encryptor.update(data)), data)
+
+    def test_nextiv(self):
+        aes = session._AesCbc(self.key)
+        ivs = [aes.nextiv() for _ in range(130)]
+        self.assertTrue(all(len(iv) == 16 for iv in ivs))
+        self.assertEqual(len(set(ivs)), len(ivs))
+
+
+class ChecksumTestCase(base.TestCase):
+
+    def setUp(self):
+        super(ChecksumTestCase, self).setUp()
+        # Session.__new__ would look up or start a real session
+        self.session = object.__new__(session.Session)
+        self.session.servermode = False
+        self.session.tabooseq = {}
+        self.session.request_entry = set()
+        self.session.rqaddr = 0x81
+        self.session.rqlun = 0
+        self.session.seqlun = 1
+
+    def test_checksum(self):
+        self.assertEqual(session._checksum(b''), 0)
+        self.assertEqual(session._checksum(b'\x20\x18'), 0xc8)
+        self.assertEqual(session._checksum(bytearray(b'\x81\x04\x01')), 0x7a)
+        self.assertEqual(session._checksum(memoryview(b'\x00\xff\x01')[1:]),
+                         0)
+
+    def test_payload(self):
+        # Get Device ID
+        self.assertEqual(
+            self.session._make_ipmi_payload(6, 1),
+            bytearray(b'\x20\x18\xc8\x81\x04\x01\x7a'))
+        # Chassis Control, power up
+        self.assertEqual(
+            self.session._make_ipmi_payload(0, 2, data=(1,)),
+            bytearray(b'\x20\x00\xe0\x81\x04\x02\x01\x78'))
+
+    def test_bridged_payload(self):
+        # Get Device ID sent through Send Message to 0x72 on channel 2
+        payload = self.session._make_ipmi_payload(
+            6, 1, bridge_request={'addr': 0x72, 'channel': 2})
+        self.assertEqual(
+            payload,
+            bytearray(b'\x20\x18\xc8\x81\x04\x34\x42'
+                      b'\x72\x18\x76\x20\x04\x01\xdb\x05'))